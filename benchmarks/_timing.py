@@ -0,0 +1,19 @@
+# coding=utf-8
+"""
+Timing helper shared by the benchmarks.
+"""
+import time
+
+
+def best_of(func, repeat=1):
+    """
+    Call `func` `repeat` times and keep the fastest run.
+
+    :return: A tuple `(seconds, result)`, `result` being returned by the last call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
@@ -0,0 +1,47 @@
+# coding=utf-8
+"""
+Compare `pad_sequences` with a loop over `pad_sequence_to_fixed_length`.
+
+    python benchmarks/bench_padding.py --num-sequences 100000 --max-length 64
+"""
+import argparse
+import sys
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from nlputils.tokenizer import pad_sequence_to_fixed_length, pad_sequences
+from _timing import best_of
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num-sequences', default=100000, type=int, help='Number of sequences.')
+    parser.add_argument('--max-length', default=64, type=int, help='Length to pad to.')
+    parser.add_argument('--mean-length', default=20, type=int, help='Mean length of the sequences.')
+    parser.add_argument('--repeat', default=3, type=int, help='Keep the best of `repeat` runs.')
+    parser.add_argument('--seed', default=0, type=int, help='Random seed.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lengths = rng.geometric(1 / args.mean_length, args.num_sequences)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    flat = rng.integers(1, 50000, offsets[-1]).astype(np.int32)
+    ragged = [flat[offsets[i]:offsets[i + 1]].tolist() for i in range(args.num_sequences)]
+
+    for padding_mode in ['right', 'left']:
+        for truncate_mode in ['right', 'left']:
+            loop_time, expected = best_of(lambda: [pad_sequence_to_fixed_length(
+                x, args.max_length, 0, padding_mode, truncate_mode) for x in ragged], args.repeat)
+            ragged_time, from_ragged = best_of(lambda: pad_sequences(
+                ragged, args.max_length, 0, padding_mode, truncate_mode), args.repeat)
+            flat_time, from_flat = best_of(lambda: pad_sequences(
+                flat, args.max_length, 0, padding_mode, truncate_mode, offsets=offsets), args.repeat)
+
+            assert from_ragged.tolist() == expected and from_flat.tolist() == expected
+            print('padding={:5s} truncate={:5s} loop {:8.1f} ms | ragged {:7.1f} ms ({:5.1f}x) | '
+                  'flat+offsets {:7.1f} ms ({:5.1f}x)'.format(
+                      padding_mode, truncate_mode, loop_time * 1e3, ragged_time * 1e3, loop_time / ragged_time,
+                      flat_time * 1e3, loop_time / flat_time))
@@ -0,0 +1,54 @@
+# coding=utf-8
+"""
+Compare the `vocab` segmenter of `BasicTokenizer` with `jieba.cut`, on speed and UNK rate.
+
+    python benchmarks/bench_segmentation.py --num-docs 20000 --min-count 2
+
+A synthetic Chinese corpus is split in two: the vocabulary is built from jieba's segmentation of
+the first part (keeping tokens seen more than `--min-count` times), then both segmenters tokenize
+the held-out part.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from nlputils import BasicTokenizer, VocabGenerator
+from synthetic import make_corpus
+from _timing import best_of
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num-docs', default=20000, type=int, help='Number of synthetic documents.')
+    parser.add_argument('--held-out', default=0.2, type=float, help='Fraction of documents to tokenize.')
+    parser.add_argument('--min-count', default=2, type=int, help='`min_count` of the vocabulary.')
+    parser.add_argument('--repeat', default=3, type=int, help='Keep the best of `repeat` runs.')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the synthetic corpus.')
+    args = parser.parse_args()
+
+    docs = make_corpus('cn', args.num_docs, seed=args.seed)
+    split = int(len(docs) * (1 - args.held_out))
+    train, test = docs[:split], docs[split:]
+
+    jieba_tokenizer = BasicTokenizer('cn')
+    generator = VocabGenerator(min_count=args.min_count)
+    vocab = generator.generate_vocab([jieba_tokenizer.tokenize(x) for x in train])
+    jieba_tokenizer.load_vocab(vocab)
+
+    start = time.perf_counter()
+    vocab_tokenizer = BasicTokenizer('cn', segmenter='vocab')
+    vocab_tokenizer.load_vocab(vocab, generator.get_token2tf())
+    vocab_tokenizer.segmenter
+    print('vocabulary of {} tokens, vocab segmenter built in {:.1f} ms'.format(
+        len(vocab), (time.perf_counter() - start) * 1e3))
+
+    for name, tokenizer in [('jieba', jieba_tokenizer), ('vocab', vocab_tokenizer)]:
+        seconds, tokenized = best_of(lambda: [tokenizer.tokenize(x) for x in test], args.repeat)
+        ids = [i for tokens in tokenized for i in tokenizer.convert_tokens_to_ids(tokens)]
+        unk_id = tokenizer.get_vocabulary().unk_id
+        print('{:<6s} {:10.1f} docs/s {:12.1f} tokens/s  UNK rate {:6.2%}'.format(
+            name, len(test) / seconds, len(ids) / seconds, ids.count(unk_id) / len(ids)))
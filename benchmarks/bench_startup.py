@@ -0,0 +1,39 @@
+# coding=utf-8
+"""
+Measure how long `import nlputils` takes, each run in a fresh interpreter.
+
+    python benchmarks/bench_startup.py --runs 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def time_import(module, runs):
+    """
+    Import `module` in `runs` fresh interpreters, return the wall time of each run in seconds.
+    The interpreter startup itself, measured with an empty program, is subtracted.
+    """
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, check=True)
+        return time.perf_counter() - start
+
+    baseline = min(run('pass') for _ in range(runs))
+    return [run(f'import {module}') - baseline for _ in range(runs)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--runs', default=10, type=int, help='Number of fresh interpreters.')
+    parser.add_argument('--module', default='nlputils', help='Module to import.')
+    args = parser.parse_args()
+
+    times = time_import(args.module, args.runs)
+    print('import {}: min {:.1f} ms, median {:.1f} ms, max {:.1f} ms over {} runs'.format(
+        args.module, min(times) * 1e3, statistics.median(times) * 1e3, max(times) * 1e3, args.runs))
@@ -0,0 +1,62 @@
+# coding=utf-8
+"""
+Measure training and encoding speed of `SubwordTokenizer` on a synthetic corpus.
+
+    python benchmarks/bench_subword.py --num-docs 1000000 --vocab-size 30000
+    python benchmarks/bench_subword.py --num-docs 10000000 --mean-words 12
+
+Word counts are gathered with `VocabGenerator.generate_vocab_from_stream`, the vocabulary is
+trained from them, then the corpus is encoded with `batch_encode`. The size of the whole-word
+vocabulary is printed for comparison.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from nlputils import SubwordTokenizer, VocabGenerator
+from synthetic import make_corpus
+from _timing import best_of
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--language', default='en', choices=['cn', 'en'], help='Language of the corpus.')
+    parser.add_argument('--num-docs', default=100000, type=int, help='Number of synthetic documents.')
+    parser.add_argument('--mean-words', default=20, type=int, help='Mean number of words of a document.')
+    parser.add_argument('--num-words', default=200000, type=int, help='Number of distinct words of the corpus.')
+    parser.add_argument('--vocab-size', default=30000, type=int, help='Size of the subword vocabulary.')
+    parser.add_argument('--batch-size', default=1000, type=int, help='Number of documents per `batch_encode`.')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the synthetic corpus.')
+    args = parser.parse_args()
+
+    seconds, docs = best_of(lambda: make_corpus(args.language, args.num_docs, args.mean_words, args.num_words,
+                                                args.seed))
+    print('generate {} docs: {:.1f} s'.format(len(docs), seconds))
+
+    tokenizer = SubwordTokenizer(args.language)
+    generator = VocabGenerator()
+    seconds, words = best_of(lambda: generator.generate_vocab_from_stream(
+        [(tokenizer._split_words(x) for x in docs)]))
+    token2tf = generator.get_token2tf()
+    num_words = sum(token2tf.values())
+    print('count words: {:.1f} s, {:.0f} docs/s, {} words, whole-word vocabulary of {} tokens'.format(
+        seconds, len(docs) / seconds, num_words, len(words)))
+
+    seconds, vocab = best_of(lambda: tokenizer.train(token2tf, args.vocab_size))
+    print('train: {:.1f} s, subword vocabulary of {} tokens'.format(seconds, len(vocab)))
+
+    def encode():
+        num_tokens = 0
+        for start in range(0, len(docs), args.batch_size):
+            _, lengths, _ = tokenizer.batch_encode(docs[start:start + args.batch_size])
+            num_tokens += int(lengths.sum())
+        return num_tokens
+
+    tokenizer.enable_instrumentation()
+    seconds, num_tokens = best_of(encode)
+    print('encode: {:.1f} s, {:.0f} docs/s, {:.0f} tokens/s, {:.2f} subwords per word, UNK rate {:.2%}'.format(
+        seconds, len(docs) / seconds, num_tokens / seconds, num_tokens / num_words,
+        tokenizer.get_stats()['unk_rate']))
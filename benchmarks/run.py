@@ -0,0 +1,211 @@
+# coding=utf-8
+"""
+Offline benchmark suite for the preprocessing hot paths, on synthetic corpora.
+
+    python benchmarks/run.py --languages cn en --num-docs 20000 --output results.json
+    python benchmarks/run.py --num-docs 20000 --compare results.json
+
+Every benchmark runs in a fresh process, so that its memory is not hidden by the peak of the
+benchmarks (or imports, e.g. torch) before it. It reports docs/sec, tokens/sec, the peak RSS of
+its process and how much the benchmark itself raised it over the setup (corpus, tokenizer and
+imports). Results are saved as JSON, `--compare` prints the speed ratio against a previous result file.
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from nlputils import BasicTokenizer, VocabGenerator, pad_sequence_to_fixed_length
+from synthetic import make_corpus
+from _timing import best_of
+
+MAX_LENGTH = 64
+BATCH_SIZE = 128
+
+BENCHMARKS = ['tokenize', 'encode', 'convert_tokens_to_ids', 'pad_sequence_to_fixed_length', 'generate_vocab',
+              'CustomDataset batch fetch', 'CustomDataset batched fetch', 'DataSequence batch fetch']
+
+
+def package_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        return version('nlputils')
+    except (ImportError, PackageNotFoundError):
+        return None
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the process, in MB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux.
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / (1 << 10)
+
+
+def measure(name, language, func, num_docs, num_tokens, repeat):
+    """
+    Run `func` `repeat` times, keep the fastest run.
+    """
+    baseline = peak_rss_mb()
+    seconds, _ = best_of(func, repeat)
+    result = {
+        'name': name,
+        'language': language,
+        'seconds': seconds,
+        'docs_per_sec': num_docs / seconds,
+        'tokens_per_sec': num_tokens / seconds,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    result['rss_increase_mb'] = result['peak_rss_mb'] - baseline
+    return result
+
+
+def print_result(result):
+    print('{:<28s} {:<3s} {:10.1f} docs/s {:12.1f} tokens/s {:8.1f} MB peak {:+8.1f} MB'.format(
+        result['name'], result['language'], result['docs_per_sec'], result['tokens_per_sec'],
+        result['peak_rss_mb'], result['rss_increase_mb']))
+
+
+def load_tokenizer(language):
+    tokenizer = BasicTokenizer(language, lazy_load=True)
+    # Warm up the backend, so that loading it is not measured.
+    try:
+        tokenizer.tokenize('warm up')
+    except (OSError, ImportError) as e:
+        print(f'Skip {language}: {e}', file=sys.stderr)
+        return None
+    return tokenizer
+
+
+def run_benchmark(language, name, args):
+    """
+    Run a single benchmark in the current process.
+
+    :return: The result as a `dict`, or `None` if it is skipped.
+    """
+    tokenizer = load_tokenizer(language)
+    if tokenizer is None:
+        return None
+
+    docs = make_corpus(language, args.num_docs, seed=args.seed)
+    tokenized = [tokenizer.tokenize(x) for x in docs]
+    num_docs = len(docs)
+    num_tokens = sum(len(x) for x in tokenized)
+    tokenizer.load_vocab(VocabGenerator().generate_vocab(tokenized))
+    ids = [tokenizer.convert_tokens_to_ids(x) for x in tokenized]
+    x_set = np.asarray([pad_sequence_to_fixed_length(x, MAX_LENGTH) for x in ids], dtype=np.int32)
+    y_set = np.zeros(num_docs, dtype=np.int64)
+
+    def fetch_batches(dataset):
+        for start in range(0, num_docs, BATCH_SIZE):
+            [dataset[i] for i in range(start, min(start + BATCH_SIZE, num_docs))]
+
+    # Heavy dependencies are only imported by the benchmarks that need them.
+    try:
+        if name == 'tokenize':
+            func = lambda: [tokenizer.tokenize(x) for x in docs]
+        elif name == 'encode':
+            func = lambda: [tokenizer.encode(x, MAX_LENGTH) for x in docs]
+        elif name == 'convert_tokens_to_ids':
+            func = lambda: [tokenizer.convert_tokens_to_ids(x) for x in tokenized]
+        elif name == 'pad_sequence_to_fixed_length':
+            func = lambda: [pad_sequence_to_fixed_length(x, MAX_LENGTH) for x in ids]
+        elif name == 'generate_vocab':
+            func = lambda: VocabGenerator().generate_vocab(tokenized)
+        elif name.startswith('CustomDataset'):
+            from nlputils.dataset import CustomDataset
+            dataset = CustomDataset(x_set, y_set)
+            if name == 'CustomDataset batch fetch':
+                func = lambda: fetch_batches(dataset)
+            else:
+                func = lambda: [dataset[np.arange(start, min(start + BATCH_SIZE, num_docs))]
+                                for start in range(0, num_docs, BATCH_SIZE)]
+        elif name == 'DataSequence batch fetch':
+            from nlputils.data_sequence import DataSequence
+            sequence = DataSequence(x_set, y_set, BATCH_SIZE, shuffle=False)
+            func = lambda: [sequence[i] for i in range(len(sequence))]
+        else:
+            raise ValueError(f'Unknown benchmark {name}.')
+    except ImportError as e:
+        print(f'Skip {name}: {e}', file=sys.stderr)
+        return None
+
+    return measure(name, language, func, num_docs, num_tokens, args.repeat)
+
+
+def run_isolated(language, name, args):
+    """
+    Run a single benchmark in a fresh Python process.
+    """
+    command = [sys.executable, __file__, '--worker', language, name, '--num-docs', str(args.num_docs),
+               '--repeat', str(args.repeat), '--seed', str(args.seed)]
+    output = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def compare(results, fpath):
+    with open(fpath, 'r', encoding='utf-8') as f:
+        previous = {(x['name'], x['language']): x for x in json.load(f)['results']}
+    print(f'\nSpeed relative to {fpath} (> 1 is faster):')
+    for result in results:
+        old = previous.get((result['name'], result['language']))
+        if old is not None:
+            print('{:<28s} {:<3s} {:6.2f}x'.format(
+                result['name'], result['language'], result['docs_per_sec'] / old['docs_per_sec']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--languages', nargs='+', default=['cn', 'en'], help='Languages to benchmark.')
+    parser.add_argument('--num-docs', default=10000, type=int, help='Number of synthetic documents.')
+    parser.add_argument('--repeat', default=3, type=int, help='Keep the fastest of `repeat` runs.')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the synthetic corpora.')
+    parser.add_argument('--only', nargs='+', default=None, help='Names of the benchmarks to run.')
+    parser.add_argument('--output', default=None, help='Save the results to this JSON file.')
+    parser.add_argument('--compare', default=None, help='A previous JSON result file to compare with.')
+    parser.add_argument('--worker', nargs=2, default=None, metavar=('LANGUAGE', 'NAME'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        # Print the result as the last line, for `run_isolated`.
+        print(json.dumps(run_benchmark(*args.worker, args)))
+        sys.exit()
+
+    results = []
+    for language in args.languages:
+        for name in BENCHMARKS:
+            if args.only is not None and name not in args.only:
+                continue
+            result = run_isolated(language, name, args)
+            if result is None and name == 'tokenize':
+                # Only the tokenizer is needed, its backend is missing.
+                break
+            if result is not None:
+                print_result(result)
+                results.append(result)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'version': package_version(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'numpy': np.__version__,
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'args': vars(args),
+                },
+                'results': results,
+            }, f, indent=2)
+    if args.compare is not None:
+        compare(results, args.compare)
@@ -0,0 +1,58 @@
+# coding=utf-8
+"""
+Reproducible synthetic corpora, so that benchmarks run offline and are comparable across versions.
+"""
+import numpy as np
+
+# The most common Chinese characters, enough to make jieba find real words.
+CN_CHARS = ('的一是不了人我在有他这为之大来以个中上们到说国和地也子时道出'
+            '而要于就下得可你年生自会那后能对着事其里所去行过家十用发天如'
+            '然作方成者多日都三小军二无同么经法当起与好看学进种将还分此心'
+            '前面又定见只主没公从知北京市场工作新闻经济世界游戏开放活力决'
+            '定风景照片网上今天气很太阳门爱救赎巨模式治安官')
+CN_PUNCTUATION = '，。！？；：'
+EN_LETTERS = 'etaoinshrdlcumwfgypbvkjxqz'
+EN_PUNCTUATION = ',.!?;:'
+
+
+def _zipf_vocab(rng, size, make_word):
+    """
+    Return `size` distinct words and Zipf-like sampling probabilities.
+    """
+    words = set()
+    while len(words) < size:
+        words.add(make_word())
+    words = sorted(words)
+    probs = 1 / np.arange(1, size + 1)
+    return words, probs / probs.sum()
+
+
+def make_corpus(language, num_docs, mean_words=20, vocab_size=5000, seed=0):
+    """
+    Generate `num_docs` documents in `language` (`cn` or `en`), with a Zipf-distributed
+    vocabulary of `vocab_size` words and geometrically distributed lengths.
+
+    :return: A list of strings.
+    """
+    rng = np.random.default_rng(seed)
+    if language == 'cn':
+        chars = list(CN_CHARS)
+        words, probs = _zipf_vocab(rng, vocab_size, lambda: ''.join(rng.choice(chars, rng.integers(1, 4))))
+        punctuation, joiner = CN_PUNCTUATION, ''
+    elif language == 'en':
+        letters = list(EN_LETTERS)
+        words, probs = _zipf_vocab(rng, vocab_size, lambda: ''.join(rng.choice(letters, rng.integers(2, 9))))
+        punctuation, joiner = EN_PUNCTUATION, ' '
+    else:
+        raise ValueError(f'Language {language} not supported.')
+
+    lengths = rng.geometric(1 / mean_words, num_docs)
+    indices = rng.choice(len(words), size=int(lengths.sum()), p=probs)
+    docs = []
+    start = 0
+    for length in lengths:
+        doc = [words[i] for i in indices[start:start + length]]
+        doc.append(punctuation[int(rng.integers(len(punctuation)))])
+        docs.append(joiner.join(doc))
+        start += length
+    return docs
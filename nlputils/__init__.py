@@ -2,7 +2,16 @@ from pathlib import Path
 
 __all__ = ['VocabGenerator',
            'BasicTokenizer',
+           'SubwordTokenizer',
+           'HashingTokenizer',
+           'Vocabulary',
+           'MappedVocabulary',
            'pad_sequence_to_fixed_length',
+           'pad_sequences',
+           'EncodedCorpus',
+           'CorpusCache',
+           'BucketBatchSampler',
+           'AsyncEncoder',
            'EarlyStopping']
 
 DATA_DIR = Path('data/')
@@ -10,8 +19,23 @@ DATA_DIR = Path('data/')
 SUPPORTED_LANGUAGES = ['cn', 'en']
 STOPWORDS_PATH_DICT = {x: DATA_DIR/f'stopwords_{str(x)}.txt' for x in SUPPORTED_LANGUAGES}
 
+from .vocabulary import Vocabulary, MappedVocabulary
 from .tokenizer import *
 from .vocab_generator import *
+from .subword_tokenizer import SubwordTokenizer
+from .hashing_tokenizer import HashingTokenizer
 from .early_stopping import EarlyStopping
+from .corpus_cache import EncodedCorpus, CorpusCache
+from .bucketing import BucketBatchSampler
+
+
+def __getattr__(name):
+    # `asyncio` is only imported when `AsyncEncoder` is used.
+    if name == 'AsyncEncoder':
+        from .async_encoder import AsyncEncoder
+        return AsyncEncoder
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 # from .data_sequence import *
 # from .dataset import *
\ No newline at end of file
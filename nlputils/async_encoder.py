@@ -0,0 +1,213 @@
+# coding=utf-8
+import asyncio
+import collections
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The tokenizer owned by a worker process of `AsyncEncoder`.
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _encode_texts(tokenizer, texts, encode_kwargs):
+    return [tokenizer.encode(t, **encode_kwargs) for t in texts]
+
+
+def _encode_texts_in_worker(texts, encode_kwargs):
+    return _encode_texts(_worker_tokenizer, texts, encode_kwargs)
+
+
+class AsyncEncoder(object):
+    """
+    An asyncio front end to a tokenizer for online inference. Concurrent `encode` calls are
+    collected into micro-batches, bounded by `max_batch_size` and `max_wait` seconds, which are
+    encoded on a thread or process pool without blocking the event loop.
+
+    ```
+    async with AsyncEncoder(tokenizer, max_length=32) as encoder:
+        ids = await encoder.encode('今天天气很好')
+    ```
+    """
+
+    def __init__(self, tokenizer, max_batch_size=32, max_wait=0.002, workers=1, use_processes=False,
+                 max_queue_size=0, latency_window=10000, **encode_kwargs):
+        """
+        :param tokenizer: A tokenizer, must be picklable if `use_processes` is set.
+        :param max_batch_size: Max number of texts in a micro-batch.
+        :param max_wait: Max time (seconds) to wait for more texts once a micro-batch has been started.
+        :param workers: Number of threads or processes, also the max number of batches in flight.
+        :param use_processes: Encode in a process pool rather than a thread pool.
+        :param max_queue_size: Max number of waiting texts, `encode` waits when the queue is full. `0` for no limit.
+        :param latency_window: Number of most recent latencies kept for the percentiles.
+        :param encode_kwargs: Passed to `tokenizer.encode`.
+        """
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_queue_size = max_queue_size
+        self.encode_kwargs = encode_kwargs
+
+        self._queue = None
+        self._dispatcher = None
+        self._closed = False
+        self._executor = None
+        self._inflight = None
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._batch_sizes = collections.Counter()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def start(self):
+        """
+        Start the dispatcher, must be called from a running event loop. `encode` starts it if needed.
+        """
+        if self._closed:
+            raise RuntimeError('AsyncEncoder is closed.')
+        if self._dispatcher is not None:
+            return
+        if self.use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(self.tokenizer,))
+            self._func = _encode_texts_in_worker
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._func = partial(_encode_texts, self.tokenizer)
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._inflight = asyncio.Semaphore(self.workers)
+        self._batches = set()
+        # `encode` calls waiting for room in a full queue.
+        self._puts = set()
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def close(self):
+        """
+        Encode every waiting text, then stop the dispatcher and the pool. `encode` raises a
+        `RuntimeError` afterwards.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._dispatcher is None:
+            return
+        await self._queue.put(None)
+        await self._dispatcher
+        # Texts still waiting for room in the queue, or queued behind the sentinel, are not encoded.
+        for put in self._puts:
+            put.cancel()
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None and not item[1].done():
+                item[1].set_exception(RuntimeError('AsyncEncoder is closed.'))
+        if self._batches:
+            await asyncio.gather(*self._batches)
+        self._executor.shutdown()
+        self._dispatcher = None
+
+    async def encode(self, text):
+        """
+        Encode a text, as `tokenizer.encode(text, **encode_kwargs)` would. Raise a `RuntimeError`
+        if the encoder is closed.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        item = (text, future, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Wait for room in a task, which `close` cancels.
+            put = asyncio.ensure_future(self._queue.put(item))
+            self._puts.add(put)
+            try:
+                await put
+            except asyncio.CancelledError:
+                if not (put.cancelled() and self._closed):
+                    raise
+                raise RuntimeError('AsyncEncoder is closed.') from None
+            finally:
+                self._puts.discard(put)
+        return await future
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            # Wait for a free worker, so that the number of batches in flight stays bounded.
+            await self._inflight.acquire()
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        texts = [text for text, _, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, self._func, texts, self.encode_kwargs)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._inflight.release()
+
+        now = time.perf_counter()
+        self._batch_sizes[len(batch)] += 1
+        for (_, future, start), result in zip(batch, results):
+            self._latencies.append(now - start)
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self):
+        """
+        Return a `dict` with the current queue depth, the number and mean size of the batches, and
+        the 50th, 90th and 99th percentiles of the latency (seconds) of the most recent requests.
+        """
+        num_batches = sum(self._batch_sizes.values())
+        num_texts = sum(size * n for size, n in self._batch_sizes.items())
+        latencies = np.asarray(self._latencies)
+        stats = {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'batches': num_batches,
+            'mean_batch_size': num_texts / num_batches if num_batches else 0.0,
+            'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+        }
+        for p in (50, 90, 99):
+            stats[f'latency_p{p}'] = float(np.percentile(latencies, p)) if len(latencies) else None
+        return stats
@@ -0,0 +1,112 @@
+# coding=utf-8
+import numpy as np
+
+
+class BucketBatchSampler(object):
+    """
+    Group samples of similar length into batches, so that each batch only needs to be padded
+    to its own longest sample.
+
+    Every epoch, indices are shuffled and split into buckets of `batch_size * bucket_size`
+    samples. Each bucket is sorted by length and cut into batches, then the order of the
+    batches is shuffled. The shuffling depends only on `seed` and the epoch, so it is
+    reproducible.
+
+    Can be passed as `batch_sampler` to a PyTorch `DataLoader`, or used by `DataSequence`.
+    """
+
+    def __init__(self, lengths, batch_size, bucket_size=100, shuffle=True, drop_last=False, seed=None):
+        """
+        :param lengths: Length of every sample.
+        :param batch_size: Number of samples in a batch.
+        :param bucket_size: Number of batches in a bucket. The larger, the less padding but the
+            less randomness.
+        :param shuffle: Set `False` to sort the whole dataset by length, without shuffling.
+        :param drop_last: Drop the last incomplete batch of each bucket.
+        :param seed: Seed of the shuffling. `None` for a random one.
+        """
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.epoch = 0
+        self._padded_cells = 0
+        self._total_cells = 0
+
+    def __len__(self):
+        return len(self.get_batches(self.epoch))
+
+    def __iter__(self):
+        batches = self.get_batches(self.epoch)
+        self.epoch += 1
+        self._padded_cells = 0
+        self._total_cells = 0
+        for batch in batches:
+            batch_lengths = self.lengths[batch]
+            cells = len(batch) * int(batch_lengths.max(initial=0))
+            self._total_cells += cells
+            self._padded_cells += cells - int(batch_lengths.sum())
+            yield batch.tolist()
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def get_batches(self, epoch):
+        """
+        Return the batches of an epoch, as a list of index arrays.
+        """
+        if self.shuffle:
+            rng = np.random.default_rng([self.seed, epoch])
+            indices = rng.permutation(len(self.lengths))
+            bucket = self.batch_size * self.bucket_size
+        else:
+            indices = np.arange(len(self.lengths))
+            bucket = max(len(indices), 1)
+
+        batches = []
+        for start in range(0, len(indices), bucket):
+            chunk = indices[start:start + bucket]
+            chunk = chunk[np.argsort(self.lengths[chunk], kind='stable')]
+            for i in range(0, len(chunk), self.batch_size):
+                batch = chunk[i:i + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+
+        if self.shuffle:
+            order = rng.permutation(len(batches))
+            batches = [batches[i] for i in order]
+        return batches
+
+    def pad_ratio(self):
+        """
+        Return the fraction of padding in the batches yielded during the last (or current) epoch.
+        """
+        return self._padded_cells / self._total_cells if self._total_cells else 0.0
+
+    def fixed_pad_ratio(self, max_length=None):
+        """
+        Return the fraction of padding if every sample were padded to `max_length` (default to the
+        longest sample), to compare with `pad_ratio`.
+        """
+        if max_length is None:
+            max_length = int(self.lengths.max(initial=0))
+        total = len(self.lengths) * max_length
+        return 1 - np.minimum(self.lengths, max_length).sum() / total if total else 0.0
+
+
+def trim_padding(batch, lengths, padding_mode='right'):
+    """
+    Drop the columns of a padded batch that are padding for every row.
+
+    :param batch: A 2-D array padded on the `padding_mode` side.
+    :param lengths: Number of non-padding values of every row.
+    :param padding_mode: Specify which side is padded. Either `right` or `left`.
+    :return: A view of `batch`.
+    """
+    assert padding_mode in ['right', 'left']
+    length = int(np.max(lengths, initial=0))
+    if padding_mode == 'right':
+        return batch[:, :length]
+    return batch[:, batch.shape[1] - length:]
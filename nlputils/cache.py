@@ -0,0 +1,108 @@
+# coding=utf-8
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _estimate_size(obj):
+    """
+    Roughly estimate the memory used by a string, or a tuple/list of strings, in bytes.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(sys.getsizeof(x) for x in obj)
+    return size
+
+
+class LRUCache(object):
+    """
+    A thread-safe Least Recently Used cache bounded by a number of entries and/or an
+    (estimated) number of bytes. Hits, misses and evictions are counted.
+
+    Only the settings are pickled, an unpickled cache is empty.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        if max_entries is None and max_bytes is None:
+            raise ValueError('Either `max_entries` or `max_bytes` must be specified.')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._bytes = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getstate__(self):
+        return {'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get(self, key, default=None):
+        """
+        Return the value of `key` and mark it as the most recently used, or `default`.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        """
+        Insert `value`, then evict the least recently used entries until the cache fits in
+        its budget. A value larger than `max_bytes` is not cached.
+        """
+        size = _estimate_size(key) + _estimate_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+
+            while (self.max_entries is not None and len(self._data) > self.max_entries) or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry. Counters are kept.
+        """
+        with self._lock:
+            self._data = OrderedDict()
+            self._bytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_stats(self):
+        """
+        Return a `dict` of hits, misses, evictions, hit rate, number of entries and
+        estimated bytes.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._data),
+            'bytes': self._bytes,
+        }
@@ -0,0 +1,259 @@
+# coding=utf-8
+import json
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def _snapshot(obj):
+    """
+    Copy every tensor of a (nested) state to the CPU, so that training can go on updating the
+    original tensors while the copy is written.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, _snapshot(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(x) for x in obj)
+    return obj
+
+
+def _atomic_write(fpath, write):
+    """
+    Call `write(f)` on a temporary file next to `fpath`, flush it to disk, then rename it to `fpath`.
+    """
+    fpath = Path(fpath)
+    tmp_path = fpath.with_name('.' + fpath.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, fpath)
+
+
+def _link_or_copy(src, dst):
+    """
+    Atomically make `dst` a hard link to `src`, or a copy where hard links are not supported.
+    """
+    tmp_path = dst.with_name('.' + dst.name + '.tmp')
+    try:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        os.link(src, tmp_path)
+    except OSError:
+        def copy(f):
+            with open(src, 'rb') as src_f:
+                shutil.copyfileobj(src_f, f, 1 << 20)
+        _atomic_write(dst, copy)
+    else:
+        os.replace(tmp_path, dst)
+
+
+class CheckpointManager(object):
+    """
+    Keep the `top_k` best checkpoints by score, plus optionally a copy of the last one for resuming.
+
+    `save` copies the state to the CPU and returns, checkpoints are written by a background thread.
+    Files are written to a temporary name and renamed, so a checkpoint on disk is always complete.
+    At most `top_k` (+1 with `save_last`) checkpoints are kept, the others are deleted. An index
+    `{prefix}.json` lists them. A manager created on a directory holding an index, e.g. when
+    training resumes, takes over the checkpoints it lists and numbers the new ones after them.
+
+    To keep the checkpoints `EarlyStopping` considers best, pass it as `stopper` and save with the
+    score given to `stopper.step`:
+
+    ```
+    stopper = EarlyStopping(mode='min')
+    manager = CheckpointManager('checkpoints/', top_k=3, stopper=stopper)
+    for epoch in range(epochs):
+        ...
+        manager.save({'model_state_dict': model.state_dict(), 'epoch': epoch}, valid_loss)
+        if stopper.step(valid_loss)[0]:
+            break
+    manager.close()
+    ```
+    """
+
+    def __init__(self, dirpath, prefix='checkpoint', top_k=1, mode='min', save_last=True, stopper=None):
+        """
+        :param dirpath: Directory of the checkpoints.
+        :param prefix: Prefix of the file names.
+        :param top_k: Number of best checkpoints kept. `0` to keep only the last one.
+        :param mode: `min` if a lower score is better, `max` otherwise.
+        :param save_last: Also keep the last checkpoint, as `{prefix}-last.pt`.
+        :param stopper: An `EarlyStopping`, whose `mode` overrides `mode`.
+        """
+        if stopper is not None:
+            mode = stopper.mode
+        assert mode in ['min', 'max']
+        self.dirpath = Path(dirpath)
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.top_k = top_k
+        self.mode = mode
+        self.save_last = save_last
+
+        self._kept = []
+        self._counter = 0
+        self._load_index()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def _load_index(self):
+        """
+        Restore the kept checkpoints from the index of a previous run, and continue the numbering
+        after the highest existing checkpoint file.
+        """
+        pattern = re.compile(re.escape(self.prefix) + r'-(\d+)\.pt$')
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.dirpath)) if m]
+        self._counter = max(numbers) + 1 if numbers else 0
+
+        index_path = self.dirpath / '{}.json'.format(self.prefix)
+        if not index_path.exists():
+            return
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index['mode'] != self.mode:
+            raise ValueError('The checkpoints in {} were saved with mode {}.'.format(self.dirpath, index['mode']))
+        self._kept = [x for x in index['kept'] if (self.dirpath / x['file']).exists()]
+        # Evict the checkpoints beyond a smaller `top_k`.
+        while len(self._kept) > self.top_k:
+            evicted = self._worst()
+            self._kept.remove(evicted)
+            os.remove(self.dirpath / evicted['file'])
+        if self._kept:
+            logger.info('Resume from {} checkpoints in {}.'.format(len(self._kept), self.dirpath))
+
+    def _is_better(self, score, other):
+        return score < other if self.mode == 'min' else score > other
+
+    def _worst(self):
+        worst = self._kept[0]
+        for x in self._kept[1:]:
+            if self._is_better(worst['score'], x['score']):
+                worst = x
+        return worst
+
+    def save(self, state, score=None):
+        """
+        Save a checkpoint in the background. Waits for the previous one to be written first, so
+        that at most one copy of the state is held in memory.
+
+        :param state: A (nested) `dict` of tensors and Python objects, e.g. `{'model_state_dict': ...}`.
+        :param score: The score of the checkpoint. `None` to only update the last checkpoint.
+        :return: `True` if the checkpoint is among the `top_k` best.
+        """
+        # Raise the error of a failed write before the kept checkpoints are updated. The previous
+        # snapshot is also released once written, before this one is taken.
+        self.wait()
+        evicted = None
+        entry = None
+        if score is not None and self.top_k > 0:
+            score = float(score)
+            if len(self._kept) < self.top_k or self._is_better(score, self._worst()['score']):
+                if len(self._kept) >= self.top_k:
+                    evicted = self._worst()
+                    self._kept.remove(evicted)
+                entry = {'score': score, 'file': '{}-{:06d}.pt'.format(self.prefix, self._counter)}
+                self._kept.append(entry)
+        self._counter += 1
+        if entry is None and not self.save_last:
+            return False
+
+        index = {'mode': self.mode, 'best': self.best_file, 'kept': sorted(
+            self._kept, key=lambda x: x['score'], reverse=self.mode == 'max')}
+        if self.save_last:
+            index['last'] = '{}-last.pt'.format(self.prefix)
+
+        snapshot = _snapshot(state)
+        self._pending = self._executor.submit(self._write, snapshot, entry, evicted, index)
+        return entry is not None
+
+    def _write(self, snapshot, entry, evicted, index):
+        def write_state(f):
+            torch.save(snapshot, f)
+
+        if entry is not None:
+            _atomic_write(self.dirpath / entry['file'], write_state)
+        if self.save_last:
+            if entry is not None:
+                # Serialize once, the last checkpoint is the same file as the new top-k one.
+                _link_or_copy(self.dirpath / entry['file'], self.dirpath / index['last'])
+            else:
+                _atomic_write(self.dirpath / index['last'], write_state)
+        _atomic_write(self.dirpath / '{}.json'.format(self.prefix),
+                      lambda f: f.write(json.dumps(index, indent=2).encode('utf-8')))
+        if evicted is not None:
+            try:
+                os.remove(self.dirpath / evicted['file'])
+            except FileNotFoundError:
+                pass
+        if entry is not None:
+            logger.info('Save checkpoint {} with score {:.5f}.'.format(entry['file'], entry['score']))
+
+    @property
+    def best_file(self):
+        if not self._kept:
+            return None
+        best = self._kept[0]
+        for x in self._kept[1:]:
+            if self._is_better(x['score'], best['score']):
+                best = x
+        return best['file']
+
+    @property
+    def best_path(self):
+        """
+        Path of the best checkpoint, `None` if none was saved with a score.
+        """
+        return None if self.best_file is None else self.dirpath / self.best_file
+
+    @property
+    def last_path(self):
+        return self.dirpath / '{}-last.pt'.format(self.prefix) if self.save_last else None
+
+    def get_checkpoints(self):
+        """
+        Return the kept checkpoints as a list of `(score, path)`, best first.
+        """
+        kept = sorted(self._kept, key=lambda x: x['score'], reverse=self.mode == 'max')
+        return [(x['score'], self.dirpath / x['file']) for x in kept]
+
+    def load_best(self, map_location=None, **kwargs):
+        """
+        Load the best checkpoint, `None` if there is none.
+
+        :param kwargs: Passed to `torch.load`.
+        """
+        self.wait()
+        path = self.best_path
+        return None if path is None else torch.load(path, map_location=map_location, **kwargs)
+
+    def load_last(self, map_location=None, **kwargs):
+        """
+        Load the last checkpoint, e.g. to resume training, `None` if there is none.
+        """
+        self.wait()
+        path = self.last_path
+        if path is None or not path.exists():
+            return None
+        return torch.load(path, map_location=map_location, **kwargs)
+
+    def wait(self):
+        """
+        Wait for the pending checkpoint to be written. Errors of the background thread are raised here.
+        """
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
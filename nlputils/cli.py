@@ -0,0 +1,295 @@
+# coding=utf-8
+"""
+Command line preprocessing pipeline.
+
+    nlputils build-vocab corpus.txt --language cn --output vocab.txt --save-tokenizer tokenizer.bin
+    nlputils encode corpus.txt --tokenizer tokenizer.bin --max-length 128 --output-dir encoded/
+    nlputils encode corpus.txt --num-buckets 262144 --language en --max-length 128 --output-dir hashed/
+
+With `--num-buckets`, tokens are hashed (see `HashingTokenizer`), so no vocabulary is built first.
+
+Inputs are streamed, either plain text (one sample per line), TSV (`--text-column`) or JSONL
+(`--text-field`), the format being guessed from the file extension unless `--format` is given.
+
+`encode` writes shards of `--shard-size` samples into the output directory: `ids-XXXXX.npy`, a
+padded int32 matrix of ids, and `lengths-XXXXX.npy`, the unpadded length of each sample. A
+`manifest.json` listing the shards is rewritten after each of them, so an interrupted run started
+again with the same arguments skips the shards already written.
+"""
+import argparse
+import array
+import hashlib
+import json
+import logging
+import os
+import sys
+from itertools import islice
+from pathlib import Path
+import numpy as np
+from .tokenizer import BasicTokenizer, Tokenizer, filter_ids, pad_sequences
+from .hashing_tokenizer import HashingTokenizer
+from .vocab_generator import VocabGenerator
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the output directory of `encode` changes.
+MANIFEST_VERSION = 1
+SUPPORTED_FORMATS = ['txt', 'tsv', 'jsonl']
+
+
+def _guess_format(fpath):
+    suffix = Path(fpath).suffix.lower()
+    if suffix == '.tsv':
+        return 'tsv'
+    if suffix in ('.jsonl', '.json'):
+        return 'jsonl'
+    return 'txt'
+
+
+def iter_texts(fpaths, fmt=None, text_column=0, text_field='text'):
+    """
+    Stream the texts of one or several input files.
+
+    :param fpaths: A list of UTF-8 files.
+    :param fmt: One of `txt`, `tsv` and `jsonl`. `None` to guess it from the extension of each file.
+    :param text_column: Index of the text column of TSV files.
+    :param text_field: Key of the text in JSONL records.
+    :return: A generator of strings.
+    """
+    for fpath in fpaths:
+        file_fmt = fmt or _guess_format(fpath)
+        if file_fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f'Format {file_fmt} not supported.')
+        with open(fpath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if file_fmt == 'txt':
+                    yield line
+                elif file_fmt == 'tsv':
+                    yield line.split('\t')[text_column]
+                elif line:
+                    yield json.loads(line)[text_field]
+
+
+def _input_signature(fpaths):
+    """
+    Identify the input files by path, size and modification time, without reading them.
+    """
+    signature = []
+    for fpath in fpaths:
+        stat = os.stat(fpath)
+        signature.append({'path': str(Path(fpath).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    return signature
+
+
+def _atomic_save(fpath, array_or_dict):
+    """
+    Write a `.npy` array or a JSON `dict` into `fpath` through a temporary file, so that an
+    interrupted write never leaves a truncated file behind.
+    """
+    tmp_path = str(fpath) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        if isinstance(array_or_dict, dict):
+            f.write(json.dumps(array_or_dict, indent=2).encode('utf-8'))
+        else:
+            np.save(f, array_or_dict)
+    os.replace(tmp_path, fpath)
+
+
+def _load_tokenizer(args):
+    if args.tokenizer is not None:
+        return Tokenizer.load_from(args.tokenizer)
+    if args.num_buckets is not None:
+        return HashingTokenizer(args.language, num_buckets=args.num_buckets, seed=args.hash_seed)
+    if args.vocab is None:
+        raise SystemExit('Either --tokenizer, --vocab or --num-buckets is required.')
+    tokenizer = BasicTokenizer(args.language, lazy_load=True, stopword_level=args.stopword_level,
+                               segmenter=args.segmenter)
+    tokenizer.load_vocab(args.vocab)
+    return tokenizer
+
+
+def build_vocab(args):
+    tokenizer = BasicTokenizer(args.language, lazy_load=True)
+    texts = iter_texts(args.inputs, args.format, args.text_column, args.text_field)
+    samples = tokenizer.tokenize_corpus(texts, args.no_stop_words, workers=args.workers,
+                                        chunk_size=args.chunk_size)
+
+    generator = VocabGenerator(min_count=args.min_count, max_size=args.max_size, coverage=args.coverage)
+    vocab = generator.generate_vocab_from_stream([samples], max_distinct_tokens=args.max_distinct_tokens,
+                                                 spill_dir=args.spill_dir)
+    generator.save_vocab_to(args.output)
+    logger.info('Save vocabulary of {} tokens to {}.'.format(len(vocab), args.output))
+    curve = generator.get_coverage_curve()
+    for target in [0.9, 0.95, 0.99, 1.0]:
+        size = next((size for size, coverage in curve if coverage >= target), None)
+        if size is not None:
+            logger.info('{:.0%} of the corpus is covered by at most {} tokens.'.format(target, size))
+
+    if args.save_tokenizer is not None:
+        tokenizer = BasicTokenizer(args.language, lazy_load=True, segmenter=args.segmenter)
+        tokenizer.load_vocab(vocab, generator.get_token2tf())
+        tokenizer.save_to(args.save_tokenizer)
+
+
+def _encode_shard(tokenizer, samples, args, pad_id, stopword_mask):
+    flat = array.array('i')
+    offsets = array.array('q', [0])
+    for tokens in samples:
+        flat.extend(tokenizer.convert_tokens_to_ids(tokens))
+        offsets.append(len(flat))
+    flat = np.frombuffer(flat, dtype=np.int32)
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    if stopword_mask is not None:
+        flat, offsets = filter_ids(flat, offsets, stopword_mask)
+
+    ids = pad_sequences(flat, args.max_length, pad_id, args.padding_mode, args.truncate_mode, np.int32, offsets)
+    lengths = np.minimum(np.diff(offsets), args.max_length).astype(np.int32)
+    return ids, lengths
+
+
+def encode(args):
+    tokenizer = _load_tokenizer(args)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / 'manifest.json'
+
+    config = {
+        'inputs': _input_signature(args.inputs),
+        'format': args.format,
+        'text_column': args.text_column,
+        'text_field': args.text_field,
+        'tokenizer': tokenizer.fingerprint(stopwords=args.no_stop_words),
+        'max_length': args.max_length,
+        'padding_mode': args.padding_mode,
+        'truncate_mode': args.truncate_mode,
+        'no_stop_words': args.no_stop_words,
+        'shard_size': args.shard_size,
+    }
+    key = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    manifest = {'version': MANIFEST_VERSION, 'key': key, 'config': config, 'dtype': 'int32',
+                'shards': [], 'num_samples': 0, 'complete': False}
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('key') != key:
+            if not args.overwrite:
+                raise SystemExit(f'{output_dir} holds the output of a different run, use --overwrite to replace it.')
+            logger.info('Overwrite the output of a different run in {}.'.format(output_dir))
+        else:
+            manifest = previous
+            # Only keep the leading shards whose files are all present.
+            for i, shard in enumerate(manifest['shards']):
+                if not ((output_dir / shard['ids']).exists() and (output_dir / shard['lengths']).exists()):
+                    manifest['shards'] = manifest['shards'][:i]
+                    manifest['complete'] = False
+                    break
+            manifest['num_samples'] = sum(x['num_samples'] for x in manifest['shards'])
+            if manifest['complete']:
+                logger.info('{} is complete, nothing to do.'.format(output_dir))
+                return
+            logger.info('Resume after {} shards ({} samples).'.format(len(manifest['shards']),
+                                                                         manifest['num_samples']))
+
+    # Skip the samples of the shards already written, before tokenizing anything.
+    texts = islice(iter_texts(args.inputs, args.format, args.text_column, args.text_field),
+                   manifest['num_samples'], None)
+    stopword_level = getattr(tokenizer, '_stopword_level', 'token')
+    samples = tokenizer.tokenize_corpus(texts, args.no_stop_words and stopword_level == 'token',
+                                        workers=args.workers, chunk_size=args.chunk_size)
+    stopword_mask = tokenizer.get_stopword_mask() if args.no_stop_words and stopword_level == 'id' else None
+    pad_id = tokenizer._convert_token_to_id(tokenizer._pad_token)
+
+    while True:
+        shard_samples = list(islice(samples, args.shard_size))
+        if not shard_samples:
+            break
+        index = len(manifest['shards'])
+        ids, lengths = _encode_shard(tokenizer, shard_samples, args, pad_id, stopword_mask)
+        shard = {'ids': 'ids-{:05d}.npy'.format(index), 'lengths': 'lengths-{:05d}.npy'.format(index),
+                 'num_samples': len(shard_samples)}
+        _atomic_save(output_dir / shard['ids'], ids)
+        _atomic_save(output_dir / shard['lengths'], lengths)
+
+        manifest['shards'].append(shard)
+        manifest['num_samples'] += len(shard_samples)
+        _atomic_save(manifest_path, manifest)
+        logger.info('Write shard {} ({} samples in total).'.format(index, manifest['num_samples']))
+
+    manifest['complete'] = True
+    _atomic_save(manifest_path, manifest)
+    logger.info('Encode {} samples into {}.'.format(manifest['num_samples'], output_dir))
+
+
+def _add_input_arguments(parser):
+    parser.add_argument('inputs', nargs='+', help='Input files.')
+    parser.add_argument('--format', default=None, choices=SUPPORTED_FORMATS,
+                        help='Format of the inputs. Guessed from the file extension by default.')
+    parser.add_argument('--text-column', default=0, type=int, help='Index of the text column of TSV inputs.')
+    parser.add_argument('--text-field', default='text', help='Key of the text in JSONL inputs.')
+    parser.add_argument('--no-stop-words', action='store_true', help='Remove stop words.')
+    parser.add_argument('--workers', default=None, type=int, help='Number of processes. Default to all cores.')
+    parser.add_argument('--chunk-size', default=1000, type=int, help='Number of samples sent to a worker at a time.')
+    parser.add_argument('--segmenter', default='jieba', choices=['jieba', 'vocab'],
+                        help='Segmenter of the saved tokenizer for build-vocab, of the tokenizer for encode --vocab.')
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='nlputils', description='Preprocess text corpora.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--log-level', default='INFO', help='Logging level.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    vocab_parser = subparsers.add_parser('build-vocab', help='Build a vocabulary.',
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    _add_input_arguments(vocab_parser)
+    vocab_parser.add_argument('--language', default='cn', choices=['cn', 'en'], help='Language of the inputs.')
+    vocab_parser.add_argument('--output', required=True, help='Vocabulary file, one token per line.')
+    vocab_parser.add_argument('--save-tokenizer', default=None, help='Also save the tokenizer into this file.')
+    vocab_parser.add_argument('--min-count', default=None, type=int,
+                              help='Keep tokens occurring more than this number of times.')
+    vocab_parser.add_argument('--max-size', default=None, type=int,
+                              help='Keep at most this number of most frequent tokens.')
+    vocab_parser.add_argument('--coverage', default=None, type=float,
+                              help='Keep the fewest tokens covering this fraction of the corpus, e.g. 0.95.')
+    vocab_parser.add_argument('--max-distinct-tokens', default=1000000, type=int,
+                              help='Spill counts to disk beyond this number of distinct tokens.')
+    vocab_parser.add_argument('--spill-dir', default=None, help='Directory for spilled counts.')
+    vocab_parser.set_defaults(func=build_vocab)
+
+    encode_parser = subparsers.add_parser('encode', help='Encode inputs into sharded id matrices.',
+                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    _add_input_arguments(encode_parser)
+    encode_parser.add_argument('--tokenizer', default=None, help='A tokenizer file saved by `build-vocab`.')
+    encode_parser.add_argument('--vocab', default=None, help='A vocabulary file, if no tokenizer file is given.')
+    encode_parser.add_argument('--num-buckets', default=None, type=int,
+                               help='Hash tokens into this number of ids, with no vocabulary needed.')
+    encode_parser.add_argument('--hash-seed', default=0, type=int, help='Seed of the hash, with --num-buckets.')
+    encode_parser.add_argument('--language', default='cn', choices=['cn', 'en'],
+                               help='Language of the inputs, with --vocab or --num-buckets.')
+    encode_parser.add_argument('--stopword-level', default='token', choices=['token', 'id'],
+                               help='Where stop words are removed, with --vocab.')
+    encode_parser.add_argument('--output-dir', required=True, help='Directory of the shards and manifest.')
+    encode_parser.add_argument('--max-length', required=True, type=int, help='Max length of a sequence.')
+    encode_parser.add_argument('--padding-mode', default='right', choices=['right', 'left'], help='Side to pad.')
+    encode_parser.add_argument('--truncate-mode', default='right', choices=['right', 'left'],
+                               help='Side to truncate.')
+    encode_parser.add_argument('--shard-size', default=100000, type=int, help='Number of samples per shard.')
+    encode_parser.add_argument('--overwrite', action='store_true',
+                               help='Replace the output of a different run in --output-dir.')
+    encode_parser.set_defaults(func=encode)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(),
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+                        datefmt='%Y-%m-%d  %H:%M:%S %a')
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+# coding=utf-8
+import array
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+from pathlib import Path
+from .tokenizer import _pad_flat, filter_ids
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout or the content of a cache entry changes.
+CACHE_VERSION = 3
+
+
+def file_signature(fpath):
+    """
+    Identify a file by path, size and modification time, without reading it.
+    """
+    stat = os.stat(fpath)
+    return {'path': str(Path(fpath).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class EncodedCorpus(object):
+    """
+    An encoded corpus stored as a flat array of ids plus offsets, sequence `i` being
+    `ids[offsets[i]:offsets[i+1]]`. Sequences are stored whole and are truncated and padded to
+    `max_length` on access, so it can be used as `x_set` of `CustomDataset` or `DataSequence`:
+
+    ```
+    corpus[i]          # A padded sequence, shape (max_length,)
+    corpus[[i, j, k]]  # A padded batch, shape (3, max_length)
+    ```
+    """
+
+    def __init__(self, ids, offsets, max_length, pad_id=0, padding_mode='right', truncate_mode='right'):
+        assert padding_mode in ['right', 'left'] and truncate_mode in ['right', 'left']
+        self.ids = ids
+        self.offsets = offsets
+        self.max_length = max_length
+        self.pad_id = pad_id
+        self.padding_mode = padding_mode
+        self.truncate_mode = truncate_mode
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def shape(self):
+        return len(self), self.max_length
+
+    def __getitem__(self, idx):
+        n = len(self)
+        if isinstance(idx, (int, np.integer)):
+            if not -n <= idx < n:
+                raise IndexError('Index {} out of range for a corpus of {} sequences.'.format(idx, n))
+            return self._pad(np.array([idx % n]))[0]
+        if isinstance(idx, slice):
+            return self._pad(np.arange(*idx.indices(n)))
+
+        # Only the requested indices are normalized, never an array as long as the corpus.
+        indices = np.asarray(idx)
+        if not indices.size and indices.dtype != bool:
+            indices = indices.astype(np.intp)
+        if indices.dtype == bool:
+            if len(indices) != n:
+                raise IndexError('Boolean index of length {} for a corpus of {} sequences.'.format(len(indices), n))
+            return self._pad(np.flatnonzero(indices))
+        if indices.size and (indices.min() < -n or indices.max() >= n):
+            raise IndexError('Index out of range for a corpus of {} sequences.'.format(n))
+        return self._pad(np.where(indices < 0, indices + n, indices))
+
+    def get_sequence(self, idx):
+        """
+        Return sequence `idx`, untruncated and unpadded.
+        """
+        return self.ids[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def get_lengths(self):
+        """
+        Return the length of every sequence, as an array.
+        """
+        return np.diff(self.offsets)
+
+    def filter_ids(self, mask):
+        """
+        Return a new corpus without the ids flagged by a boolean `mask` over the vocabulary, e.g.
+        `tokenizer.get_stopword_mask()`. Stopwords can thus be changed without encoding the corpus again.
+        Sequences are truncated after filtering, as when encoding with the stopwords removed.
+        """
+        ids, offsets = filter_ids(self.ids, self.offsets, mask)
+        return EncodedCorpus(ids, offsets, self.max_length, self.pad_id, self.padding_mode, self.truncate_mode)
+
+    def to_matrix(self):
+        """
+        Return the whole corpus as a padded matrix.
+        """
+        return self._pad(np.arange(len(self)))
+
+    def _pad(self, indices):
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        return _pad_flat(self.ids, starts, lengths, self.max_length, self.pad_id, self.padding_mode,
+                         self.truncate_mode, self.ids.dtype)
+
+    def save(self, dpath):
+        """
+        Save the corpus into directory `dpath`.
+        """
+        dpath = Path(dpath)
+        dpath.mkdir(parents=True, exist_ok=True)
+        np.save(dpath / 'ids.npy', self.ids)
+        np.save(dpath / 'offsets.npy', self.offsets)
+        with open(dpath / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'max_length': self.max_length, 'pad_id': int(self.pad_id),
+                       'padding_mode': self.padding_mode, 'truncate_mode': self.truncate_mode}, f)
+
+    @classmethod
+    def load(cls, dpath, mmap=True, **kwargs):
+        """
+        Load a corpus saved by `save`. With `mmap`, the arrays are memory-mapped rather than read.
+
+        :param kwargs: Override the saved `max_length`, `pad_id`, `padding_mode` or `truncate_mode`.
+        """
+        dpath = Path(dpath)
+        mmap_mode = 'r' if mmap else None
+        with open(dpath / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        meta.update(kwargs)
+        return cls(np.load(dpath / 'ids.npy', mmap_mode=mmap_mode),
+                   np.load(dpath / 'offsets.npy', mmap_mode=mmap_mode), **meta)
+
+
+class CorpusCache(object):
+    """
+    An on-disk cache of encoded corpora. An entry is keyed on the input file (path, size and
+    modification time, so that a warm start does not read it) and the fingerprint of the tokenizer
+    (vocabulary, settings, and stopwords if they are removed), so it is rebuilt whenever any of
+    them changes.
+
+    Entries hold untruncated sequences: `max_length`, `padding_mode` and `truncate_mode` are applied
+    on access, so changing them does not encode the file again. Neither does changing the stopwords
+    of an entry encoded without removing them, see `EncodedCorpus.filter_ids`.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, fpath, tokenizer, no_stop_words=False):
+        """
+        Return the cache key of a file encoded by `tokenizer`. The stopwords are only part of it
+        with `no_stop_words`.
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps({
+            'version': CACHE_VERSION,
+            'file': file_signature(fpath),
+            'tokenizer': tokenizer.fingerprint(stopwords=no_stop_words),
+            'no_stop_words': no_stop_words,
+        }, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def load_or_build(self, fpath, tokenizer, max_length, padding_mode='right', truncate_mode='right',
+                      no_stop_words=False, workers=1):
+        """
+        Return the `EncodedCorpus` of a UTF-8 file with one sample per line, encoding it
+        (with `workers` processes) only if it is not in the cache yet.
+
+        :param fpath: The file to encode.
+        :param tokenizer: A tokenizer implementing `fingerprint`.
+        :param max_length: Max length of a sequence.
+        :param padding_mode: Specify which side to pad. Either `right` or `left`.
+        :param truncate_mode: Which side to truncate.
+        :param no_stop_words: Set `True` to remove stop words.
+        :param workers: Number of processes used for tokenization.
+        :return: A memory-mapped `EncodedCorpus`.
+        """
+        supported_mode = ['right', 'left']
+        assert padding_mode in supported_mode and truncate_mode in supported_mode
+
+        key = self.get_key(fpath, tokenizer, no_stop_words)
+        entry = self.cache_dir / key
+        options = {'max_length': max_length, 'padding_mode': padding_mode, 'truncate_mode': truncate_mode}
+        if (entry / 'meta.json').exists():
+            logger.info('Load encoded corpus of {} from cache {}.'.format(fpath, entry))
+            return EncodedCorpus.load(entry, **options)
+
+        logger.info('Encode {} into cache {}.'.format(fpath, entry))
+        corpus = self._encode_file(fpath, tokenizer, no_stop_words, workers)
+        # Write into a temporary directory first, so that an interrupted build leaves no entry behind.
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            corpus.save(tmp_dir)
+            os.replace(tmp_dir, entry)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not (entry / 'meta.json').exists():
+                raise
+        return EncodedCorpus.load(entry, **options)
+
+    def _encode_file(self, fpath, tokenizer, no_stop_words, workers):
+        # Remove the stopwords as `tokenizer.encode` does, from the tokens or from the ids.
+        remove_stop_ids = no_stop_words and getattr(tokenizer, '_stopword_level', 'token') == 'id'
+        ids = array.array('i')
+        offsets = array.array('q', [0])
+        with open(fpath, 'r', encoding='utf-8') as f:
+            lines = (line.rstrip('\n') for line in f)
+            for tokens in tokenizer.tokenize_corpus(lines, no_stop_words and not remove_stop_ids, workers=workers):
+                ids.extend(tokenizer.convert_tokens_to_ids(tokens))
+                offsets.append(len(ids))
+        ids = np.frombuffer(ids, dtype=np.int32)
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        if remove_stop_ids:
+            ids, offsets = filter_ids(ids, offsets, tokenizer.get_stopword_mask())
+
+        pad_id = tokenizer._convert_token_to_id(tokenizer._pad_token)
+        max_length = int(np.diff(offsets).max(initial=0))
+        return EncodedCorpus(ids, offsets, max_length, pad_id)
+
+    def clear(self):
+        """
+        Remove every entry of the cache.
+        """
+        for entry in self.cache_dir.iterdir():
+            shutil.rmtree(entry, ignore_errors=True)
@@ -1,30 +1,251 @@
 # coding=utf-8
 from tensorflow import keras
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from .bucketing import BucketBatchSampler, trim_padding
 
 
 class DataSequence(keras.utils.Sequence):
-    def __init__(self, x_set, y_set, batch_size, shuffle=True):
+    """
+    A Keras `Sequence` over `(x_set, y_set)`, batches being built in a background thread.
+
+    While batch `idx` is consumed, batches `idx+1` to `idx+prefetch` are already being gathered.
+    Prefetching only helps when batches are fetched in order, i.e. with `shuffle=False` in
+    `model.fit` (the samples can still be shuffled by this sequence, with its own `shuffle`). A
+    batch fetched out of order is built on the spot, and prefetching only resumes once batch
+    `idx+1` is fetched after batch `idx`. The time spent waiting for batches is recorded, see
+    `get_stats`. `__getitem__` can be called from several threads (Keras with `workers > 1`).
+
+    With `reuse_buffers`, batches are written into preallocated buffers (at most `2 * prefetch + 3`
+    pairs) that are recycled. A returned batch stays valid while the next `prefetch + 1` batches are
+    fetched, in any order, and its buffer is reused afterwards. Only enable it if batches are not
+    kept longer, e.g. not with Keras `workers > 1`, whose queue holds batches.
+
+    Shuffling depends only on `seed` and the epoch, so it is reproducible.
+    """
+
+    def __init__(self, x_set, y_set, batch_size, shuffle=True, lengths=None, padding_mode='right',
+                 bucket_size=100, seed=None, prefetch=2, reuse_buffers=False):
+        """
+        With `lengths` (the number of non-padding ids of every sample), samples of similar length are
+        batched together and each batch is only padded to its own longest sample, see `BucketBatchSampler`.
+        `x_set` must then be padded on the `padding_mode` side.
+
+        :param x_set: Samples, a NumPy array or any object indexable by an array of indices (e.g.
+            `EncodedCorpus`).
+        :param y_set: Labels.
+        :param batch_size: Number of samples in a batch.
+        :param shuffle: Shuffle the samples every epoch.
+        :param seed: Seed of the shuffling. `None` for a random one.
+        :param prefetch: Number of batches built ahead in the background. `0` to build them on demand.
+        :param reuse_buffers: Write batches into preallocated buffers rather than new arrays, see above.
+        """
+        super(DataSequence, self).__init__()
         assert len(x_set) == len(y_set)
         self.x, self.y = x_set, y_set
         self.batch_size = batch_size
-        self.indices = np.arange(self.x.shape[0])
         self.shuffle = shuffle
-        self._length = int(np.ceil(len(self.x) / float(self.batch_size)))
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.epoch = 0
+        self.prefetch = prefetch
+        self.reuse_buffers = reuse_buffers
+
+        self.padding_mode = padding_mode
+        self.sampler = None
+        if lengths is not None:
+            self.sampler = BucketBatchSampler(lengths, batch_size, bucket_size, shuffle, seed=self.seed)
+        self._set_batches()
+
+        self._free_buffers = []
+        self._returned_buffers = collections.deque()
+        self._buffer_shape = None
+        self._executor = None
+        self._pending = collections.OrderedDict()
+        self._last_idx = None
+        # Guards the pending batches, the buffers and the stats.
+        self._lock = threading.Lock()
+        self.reset_stats()
 
     def __len__(self):
-        return self._length
+        return len(self._batches)
 
     def __getitem__(self, idx):
-        # Fetch a batch of samples.
-        batch_indices = self.indices[idx * self.batch_size: min(self.__len__(), (idx + 1)) * self.batch_size]
-        batch_x = self.x[batch_indices]
-        batch_y = self.y[batch_indices]
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
 
-        # ....Process.....
+        start = time.perf_counter()
+        with self._lock:
+            in_order = idx == 0 or idx - 1 == self._last_idx
+            self._last_idx = idx
+            pending = self._pending.pop(idx, None)
+            if pending is None:
+                # Out of order access, the batches prefetched so far are useless.
+                self._drop_pending()
+                buffers = self._take_buffer()
+            else:
+                buffers = pending[1]
+        # Other threads can fetch their batches meanwhile.
+        batch = pending[0].result() if pending is not None else self._load(idx, buffers)
 
-        return np.asarray(batch_x), np.asarray(batch_y)
+        with self._lock:
+            if pending is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+            self._wait_seconds += time.perf_counter() - start
+            self._batches_served += 1
+            self._release_buffer(buffers)
 
-    def on_epoch_end(self):
+            if in_order:
+                window = range(idx + 1, min(idx + 1 + self.prefetch, len(self)))
+                # Batches prefetched before the requested one will not be fetched in order.
+                self._drop_pending(keep=window)
+                self._schedule(window)
+        return batch
+
+    def _set_batches(self):
+        """
+        Compute the batches (arrays of sample indices) of the current epoch.
+        """
+        if self.sampler is not None:
+            self.sampler.set_epoch(self.epoch)
+            self._batches = self.sampler.get_batches(self.epoch)
+            return
+
+        indices = np.arange(len(self.x))
         if self.shuffle:
-            np.random.shuffle(self.indices)
\ No newline at end of file
+            indices = np.random.default_rng([self.seed, self.epoch]).permutation(len(self.x))
+        self._batches = [indices[i:min(i + self.batch_size, len(indices))]
+                         for i in range(0, len(indices), self.batch_size)]
+
+    def _take_buffer(self):
+        """
+        Return a free pair of `(x, y)` buffers, allocated if there is none, or `None` if buffers are
+        not reused.
+        """
+        if not self.reuse_buffers:
+            return None
+        if self._free_buffers:
+            return self._free_buffers.pop()
+        if self._buffer_shape is None:
+            sample_x = np.asarray(self.x[np.arange(1)])
+            sample_y = np.asarray(self.y[np.arange(1)])
+            self._buffer_shape = (((self.batch_size,) + sample_x.shape[1:], sample_x.dtype),
+                                  ((self.batch_size,) + sample_y.shape[1:], sample_y.dtype))
+        return tuple(np.empty(shape, dtype=dtype) for shape, dtype in self._buffer_shape)
+
+    def _release_buffer(self, buffers):
+        """
+        Record the buffers of a returned batch. Those of the batch returned `prefetch + 2` fetches
+        ago are free again.
+        """
+        if buffers is None:
+            return
+        self._returned_buffers.append(buffers)
+        if len(self._returned_buffers) > self.prefetch + 2:
+            self._free_buffers.append(self._returned_buffers.popleft())
+
+    def _gather(self, data, indices, out):
+        if out is None:
+            return np.asarray(data[indices])
+        out = out[:len(indices)]
+        if isinstance(data, np.ndarray):
+            np.take(data, indices, axis=0, out=out)
+        else:
+            out[...] = data[indices]
+        return out
+
+    def _load(self, idx, buffers):
+        batch_indices = self._batches[idx]
+        out_x, out_y = buffers if buffers is not None else (None, None)
+        batch_x = self._gather(self.x, batch_indices, out_x)
+        batch_y = self._gather(self.y, batch_indices, out_y)
+        if self.sampler is not None:
+            batch_x = trim_padding(batch_x, self.sampler.lengths[batch_indices], self.padding_mode)
+        return batch_x, batch_y
+
+    def _schedule(self, indices):
+        if self.prefetch <= 0:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        for i in indices:
+            if i not in self._pending:
+                buffers = self._take_buffer()
+                self._pending[i] = (self._executor.submit(self._load, i, buffers), buffers)
+
+    def _drop_pending(self, keep=()):
+        """
+        Cancel or wait for the prefetched batches, except those in `keep`, so that their buffers
+        can be reused.
+        """
+        for i in [i for i in self._pending if i not in keep]:
+            future, buffers = self._pending.pop(i)
+            if not future.cancel():
+                future.exception()
+            if buffers is not None:
+                self._free_buffers.append(buffers)
+
+    def on_epoch_end(self):
+        with self._lock:
+            self._drop_pending()
+            self.epoch += 1
+            self._last_idx = None
+            self._set_batches()
+            # Start building the first batches of the next epoch right away.
+            self._schedule(range(min(self.prefetch, len(self))))
+
+    def pad_ratio(self):
+        """
+        Return the fraction of padding in the batches of the current epoch, `None` without bucketing.
+        """
+        if self.sampler is None:
+            return None
+        lengths = self.sampler.lengths
+        cells = sum(len(b) * int(lengths[b].max(initial=0)) for b in self._batches)
+        return 1 - lengths.sum() / cells if cells else 0.0
+
+    def get_stats(self):
+        """
+        Return a `dict` with the number of batches served, how many of them were prefetched, and the
+        total and mean time (seconds) `__getitem__` waited for a batch to be ready.
+        """
+        served = self._batches_served
+        return {
+            'batches': served,
+            'prefetch_hits': self._hits,
+            'prefetch_misses': self._misses,
+            'wait_seconds': self._wait_seconds,
+            'mean_wait_seconds': self._wait_seconds / served if served else 0.0,
+        }
+
+    def reset_stats(self):
+        self._batches_served = 0
+        self._hits = 0
+        self._misses = 0
+        self._wait_seconds = 0.0
+
+    def __getstate__(self):
+        # The background thread and the buffers are not pickled, e.g. for Keras workers.
+        state = self.__dict__.copy()
+        state.update(_free_buffers=[], _returned_buffers=collections.deque(), _executor=None,
+                     _pending=collections.OrderedDict())
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def close(self):
+        """
+        Stop the background thread.
+        """
+        with self._lock:
+            self._drop_pending()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
@@ -1,10 +1,28 @@
 # coding=utf-8
 import torch
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import BatchSampler, DataLoader, Dataset, IterableDataset, RandomSampler, SequentialSampler
+from torch.utils.data import get_worker_info
 import numpy as np
+from pathlib import Path
+from .bucketing import trim_padding
+
+
+def _take(data, indices):
+    """
+    Gather the rows `indices` of `data` in one operation, into a contiguous array.
+    """
+    if isinstance(data, np.ndarray):
+        return np.take(data, indices, axis=0)
+    return np.ascontiguousarray(data[indices])
 
 
 class CustomDataset(Dataset):
+    """
+    A map-style dataset over `(x_set, y_set)`. An integer index returns a sample, a list or an
+    array of indices returns a whole batch `(x, y)`, gathered with a single `np.take` per array
+    rather than sample by sample. See `make_batch_loader` to load batches this way.
+    """
+
     def __init__(self, x_set, y_set):
         assert len(x_set) == len(y_set)
         self.x, self.y = x_set, y_set
@@ -15,8 +33,132 @@ class CustomDataset(Dataset):
         return self._length
 
     def __getitem__(self, idx):
+        if not isinstance(idx, (int, np.integer)):
+            return self.get_batch(idx)
+
         #  Fetching a data sample for a given key.
         sample_x = np.asarray(self.x[idx])
         sample_y = np.asarray(self.y[idx])
 
-        return sample_x, sample_y
\ No newline at end of file
+        return sample_x, sample_y
+
+    def get_batch(self, indices):
+        """
+        Return the samples `indices` as a tuple `(x, y)` of contiguous arrays.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return _take(self.x, indices), _take(self.y, indices)
+
+
+def to_tensors(batch):
+    """
+    A `collate_fn` turning a batch of arrays (or a tuple of them) into tensors sharing their memory.
+    """
+    if isinstance(batch, (tuple, list)):
+        return type(batch)(to_tensors(x) for x in batch)
+    return torch.from_numpy(np.ascontiguousarray(batch))
+
+
+def make_batch_loader(dataset, batch_size, shuffle=False, drop_last=False, generator=None, **kwargs):
+    """
+    Build a `DataLoader` fetching each batch with one call to `dataset[indices]` (e.g. a
+    `CustomDataset`), instead of fetching samples one by one and stacking them in `collate_fn`.
+    Arrays are turned into tensors without copy. With `pin_memory=True`, batches are copied
+    once into pinned memory by the loader.
+
+    :param dataset: A dataset accepting a list of indices.
+    :param batch_size: Number of samples in a batch.
+    :param shuffle: Shuffle the samples every epoch.
+    :param drop_last: Drop the last incomplete batch.
+    :param generator: A `torch.Generator` for the shuffling.
+    :param kwargs: Passed to `DataLoader`, e.g. `num_workers` or `pin_memory`.
+    """
+    sampler = RandomSampler(dataset, generator=generator) if shuffle else SequentialSampler(dataset)
+    kwargs.setdefault('collate_fn', to_tensors)
+    return DataLoader(dataset, sampler=BatchSampler(sampler, batch_size, drop_last), batch_size=None, **kwargs)
+
+
+class ShardedIterableDataset(IterableDataset):
+    """
+    An iterable dataset streaming the lines of UTF-8 files, split between the workers of a
+    `DataLoader` so that every line is yielded exactly once per epoch.
+
+    With at least as many files as workers, each worker reads its own files (file `i` goes to
+    worker `i % num_workers`). Otherwise every worker reads all files and keeps one line out of
+    `num_workers`. Lines are yielded in file order within a worker.
+
+    ```
+    dataset = ShardedIterableDataset(fpaths, transform=partial(tokenizer.encode, max_length=64))
+    loader = DataLoader(dataset, batch_size=128, num_workers=4)
+    ```
+    """
+
+    def __init__(self, fpaths, transform=None):
+        """
+        :param fpaths: A file path or a list of them, one sample per line.
+        :param transform: Called on every line (without its line break), must be picklable to be
+            used by workers.
+        """
+        self.fpaths = [fpaths] if isinstance(fpaths, (str, Path)) else list(fpaths)
+        self.transform = transform
+
+    def _iter_lines(self, fpaths, stride=1, offset=0):
+        i = 0
+        for fpath in fpaths:
+            with open(fpath, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if i % stride == offset:
+                        yield line.rstrip('\n')
+                    i += 1
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        if worker_info is None:
+            lines = self._iter_lines(self.fpaths)
+        elif len(self.fpaths) >= worker_info.num_workers:
+            lines = self._iter_lines(self.fpaths[worker_info.id::worker_info.num_workers])
+        else:
+            lines = self._iter_lines(self.fpaths, worker_info.num_workers, worker_info.id)
+
+        if self.transform is None:
+            return lines
+        return map(self.transform, lines)
+
+
+class DynamicPaddingCollator(object):
+    """
+    A `collate_fn` that pads each batch only to its own longest sequence. Sequences can be
+    ragged, or already padded with `pad_value` on the `padding_mode` side, in which case the
+    columns that are padding for the whole batch are dropped.
+
+    Use it with a `BucketBatchSampler` to keep the batches mostly free of padding:
+
+    ```
+    sampler = BucketBatchSampler(corpus.get_lengths(), batch_size=128)
+    loader = DataLoader(CustomDataset(corpus, y_set), batch_sampler=sampler,
+                        collate_fn=DynamicPaddingCollator(pad_id))
+    ```
+    """
+
+    def __init__(self, pad_value=0, padding_mode='right'):
+        assert padding_mode in ['right', 'left']
+        self.pad_value = pad_value
+        self.padding_mode = padding_mode
+
+    def __call__(self, samples):
+        """
+        :return: A tuple `(x, y, lengths)` of tensors.
+        """
+        xs = [np.asarray(x) for x, _ in samples]
+        width = max((len(x) for x in xs), default=0)
+        batch = np.full((len(xs), width), self.pad_value, dtype=xs[0].dtype if xs else np.int64)
+        for i, x in enumerate(xs):
+            if self.padding_mode == 'right':
+                batch[i, :len(x)] = x
+            else:
+                batch[i, width - len(x):] = x
+
+        lengths = (batch != self.pad_value).sum(axis=1)
+        batch = np.ascontiguousarray(trim_padding(batch, lengths, self.padding_mode))
+        y = np.asarray([y for _, y in samples])
+        return torch.from_numpy(batch), torch.from_numpy(y), torch.from_numpy(lengths)
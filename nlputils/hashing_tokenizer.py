@@ -0,0 +1,189 @@
+# coding=utf-8
+import zlib
+from .tokenizer import Tokenizer, DEFAULT_SPECIAL_TOKENS
+from .subword_tokenizer import _WORD_PATTERN
+
+_MASK32 = 0xffffffff
+
+
+def _mix32(h):
+    """
+    The 32 bits finalizer of MurmurHash3, a bijection whose low bits depend on all the bits of `h`.
+    """
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & _MASK32
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & _MASK32
+    h ^= h >> 16
+    return h
+
+
+class HashingTokenizer(Tokenizer):
+    """
+    A tokenizer without vocabulary (the hashing trick): every token is mapped to one of
+    `num_buckets` ids by a stable, seeded hash. Strings can be encoded in a single pass over the
+    corpus, with no `VocabGenerator` pass before, and memory does not grow with the number of
+    distinct tokens.
+
+    Special tokens keep the first ids, in the order of `DEFAULT_SPECIAL_TOKENS` (`pad_token` is 0),
+    then come the buckets, so an embedding table needs `vocab_size` rows. Distinct tokens may share
+    a bucket, more buckets mean fewer collisions.
+
+    The hash is CRC-32 mixed with the seed by the MurmurHash3 finalizer. It does not depend on the
+    process (unlike `hash`), so ids are the same across runs and workers, and a different `seed`
+    gives different collisions.
+
+    With `char_ngrams=(min_n, max_n)`, each word is followed by its character n-grams, computed on
+    the word between `<` and `>` as in fastText, so that rare and unseen words share features with
+    known ones. The word itself is then emitted as `<word>` too, so that it never hashes like one of
+    its n-grams (e.g. the word `hi` and the 2-gram `hi` of `<hi>`). This suits bag-of-features
+    models (e.g. `torch.nn.EmbeddingBag`).
+
+    ```
+    tokenizer = HashingTokenizer('en', num_buckets=2 ** 18)
+    ids, lengths, mask = tokenizer.batch_encode(strings, max_length=64)
+    ```
+
+    Supported languages: `cn` (words are segmented by jieba), `en` (words are runs of letters and
+    digits, and single punctuation marks).
+    """
+
+    def __init__(self, language='en', num_buckets=2 ** 20, seed=0, lowercase=False, char_ngrams=None, **kwargs):
+        """
+        :param language: `cn` or `en`, select how strings are split into words.
+        :param num_buckets: Number of ids shared by the hashed tokens.
+        :param seed: Seed of the hash.
+        :param lowercase: Set `True` to lowercase strings before splitting them.
+        :param char_ngrams: A pair `(min_n, max_n)` to add the character n-grams of every word.
+            `None` for words only.
+        :param kwargs: Special tokens, see `Tokenizer`.
+        """
+        if language not in ['cn', 'en']:
+            raise ValueError(f'Language {language} not supported.')
+        if num_buckets <= 0:
+            raise ValueError('num_buckets must be positive.')
+        if char_ngrams is not None:
+            char_ngrams = tuple(char_ngrams)
+            if len(char_ngrams) != 2 or not 0 < char_ngrams[0] <= char_ngrams[1]:
+                raise ValueError('char_ngrams must be a pair (min_n, max_n) with 0 < min_n <= max_n.')
+        self._language = language
+        self.num_buckets = num_buckets
+        self.seed = seed
+        self.lowercase = lowercase
+        self.char_ngrams = char_ngrams
+        super(HashingTokenizer, self).__init__(**kwargs)
+
+        self._vocab = self._get_special_tokens()
+        self._token2id = {t: i for i, t in enumerate(self._vocab)}
+        self._id2token = dict(enumerate(self._vocab))
+        self._seed32 = _mix32(seed & _MASK32)
+
+    def _get_special_tokens(self):
+        tokens = [getattr(self, '_' + x) for x in DEFAULT_SPECIAL_TOKENS]
+        return tokens + [x for x in self._additional_special_tokens if x not in tokens]
+
+    @property
+    def vocab_size(self):
+        """
+        Number of ids, special tokens included, e.g. the number of rows of an embedding table.
+        """
+        return len(self._vocab) + self.num_buckets
+
+    def _split_words(self, string):
+        if self.lowercase:
+            string = string.lower()
+        if self._language == 'cn':
+            import jieba
+            return [w for w in jieba.cut(string) if not w.isspace()]
+        return _WORD_PATTERN.findall(string)
+
+    def _prepare_workers(self):
+        if self._language == 'cn':
+            # Build the prefix dict once, forked workers inherit it.
+            import jieba
+            jieba.initialize()
+
+    def tokenize(self, string):
+        """
+        Tokenize a string into words. With `char_ngrams`, each word is emitted as `<word>` followed by
+        its character n-grams.
+        """
+        with self._stage('segment'):
+            words = self._split_words(string)
+            if self.char_ngrams is None:
+                return words
+            min_n, max_n = self.char_ngrams
+            tokens = []
+            for word in words:
+                marked = '<' + word + '>'
+                tokens.append(marked)
+                # The whole `<word>` is the word token itself, not one of its n-grams.
+                for n in range(min_n, min(max_n, len(marked) - 1) + 1):
+                    tokens.extend(marked[i:i + n] for i in range(len(marked) - n + 1))
+        return tokens
+
+    def _convert_token_to_id(self, token):
+        index = self._token2id.get(token)
+        if index is None:
+            h = _mix32(zlib.crc32(token.encode('utf-8')) ^ self._seed32)
+            index = len(self._vocab) + h % self.num_buckets
+        return index
+
+    def _convert_id_to_token(self, index):
+        """
+        Hashing cannot be reversed, the id of a hashed token is returned as `[HASH_<bucket>]`.
+        """
+        token = self._id2token.get(index)
+        if token is None:
+            token = '[HASH_{}]'.format(int(index) - len(self._vocab))
+        return token
+
+    def convert_tokens_to_ids(self, tokens):
+        """
+        Convert a list of tokens to a list of ids. Special tokens get their reserved id, the others
+        are hashed.
+        """
+        with self._stage('convert'):
+            token2id = self._token2id
+            offset = len(self._vocab)
+            num_buckets = self.num_buckets
+            seed = self._seed32
+            crc32 = zlib.crc32
+            ids = []
+            for token in tokens:
+                index = token2id.get(token)
+                if index is None:
+                    index = offset + _mix32(crc32(token.encode('utf-8')) ^ seed) % num_buckets
+                ids.append(index)
+        if self._stats is not None:
+            self._stats.count('tokens', len(ids))
+        return ids
+
+    def convert_ids_to_tokens(self, ids):
+        """
+        Convert a list (or a NumPy array) of ids to a list of tokens, see `_convert_id_to_token`.
+        """
+        return [self._convert_id_to_token(x) for x in ids]
+
+    def convert_tokens_to_string(self, tokens):
+        separator = '' if self._language == 'cn' else ' '
+        return separator.join(tokens)
+
+    def _get_config(self):
+        config = {'language': self._language, 'num_buckets': self.num_buckets, 'seed': self.seed,
+                  'lowercase': self.lowercase,
+                  'char_ngrams': list(self.char_ngrams) if self.char_ngrams is not None else None}
+        for key in self._SPECIAL_TOKENS_ATTRIBUTES:
+            config[key] = getattr(self, '_' + key)
+        return config
+
+    def _set_vocabulary(self, vocabulary):
+        # There is no vocabulary besides the special tokens, which the config already rebuilt.
+        if list(vocabulary.get_tokens()) != self._vocab:
+            raise ValueError('The saved special tokens do not match the config of the tokenizer.')
+
+    def load_vocab(self, src):
+        """
+        Not supported, a hashing tokenizer has no vocabulary.
+        """
+        raise TypeError('HashingTokenizer maps tokens to ids by hashing, it has no vocabulary to load.')
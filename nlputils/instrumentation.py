@@ -0,0 +1,89 @@
+# coding=utf-8
+import threading
+import time
+from contextlib import nullcontext
+
+# Returned instead of a timer when instrumentation is disabled, so that a disabled stage
+# costs a single `with` on a shared object.
+NULL_STAGE = nullcontext()
+
+
+class _StageTimer(object):
+    __slots__ = ('_stats', '_name', '_start')
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stats.add_time(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class PipelineStats(object):
+    """
+    Cumulative time and number of calls per pipeline stage, plus event counters.
+
+    ```
+    stats = PipelineStats()
+    with stats.stage('segment'):
+        ...
+    stats.count('tokens', 42)
+    stats.snapshot()
+    ```
+
+    If `callback` is given, it is called with `(stage, seconds)` every time a stage completes.
+
+    A pickled copy (e.g. sent to a worker process) starts empty and without `callback`, which may
+    not be picklable. Statistics recorded by copies are not merged back.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def reset(self):
+        with self._lock:
+            self._seconds = {}
+            self._calls = {}
+            self._counters = {}
+
+    def stage(self, name):
+        """
+        Return a context manager timing stage `name`.
+        """
+        return _StageTimer(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+            self._calls[name] = self._calls.get(name, 0) + calls
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self):
+        """
+        Return a copy of the statistics as a `dict`:
+        `{'stages': {name: {'seconds': ..., 'calls': ...}}, 'counters': {name: ...}}`.
+        """
+        with self._lock:
+            return {
+                'stages': {name: {'seconds': self._seconds[name], 'calls': self._calls[name]}
+                           for name in self._seconds},
+                'counters': dict(self._counters),
+            }
@@ -0,0 +1,163 @@
+# coding=utf-8
+import numpy as np
+import torch
+
+
+def _float_dtype(device):
+    # MPS has no float64.
+    return torch.float32 if device.type == 'mps' else torch.float64
+
+
+class MeanMetric(object):
+    """
+    A sample-weighted running mean, accumulated on the device of its inputs. Nothing is copied
+    to the host until `compute`.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._total = None
+        self._weight = None
+
+    def update(self, value, weight=1):
+        """
+        :param value: A scalar tensor, e.g. the mean loss of a batch.
+        :param weight: Its weight, e.g. the number of samples of the batch.
+        """
+        value = value.detach().to(_float_dtype(value.device)) * weight
+        if self._total is None:
+            self._total = torch.zeros((), dtype=value.dtype, device=value.device)
+            self._weight = torch.zeros((), dtype=value.dtype, device=value.device)
+        self._total += value
+        self._weight += weight
+
+    def state(self):
+        """
+        Return the accumulated `(total, weight)` as a tensor on the device.
+        """
+        if self._total is None:
+            return torch.zeros(2, dtype=torch.float64)
+        return torch.stack([self._total, self._weight])
+
+    @staticmethod
+    def from_state(state):
+        total, weight = state.tolist()
+        return total / weight if weight else 0.0
+
+    def compute(self):
+        return self.from_state(self.state().cpu())
+
+
+class ConfusionMatrix(object):
+    """
+    A confusion matrix (rows are targets, columns are predictions) accumulated on the device of
+    its inputs with one `bincount` per batch. Accuracy, precision and recall are derived from it.
+    """
+
+    def __init__(self, num_classes=None):
+        """
+        :param num_classes: Number of classes. `None` to take it from the width of the first logits.
+        """
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        self._matrix = None
+
+    def update(self, outputs, targets):
+        """
+        :param outputs: Logits of shape `(batch, num_classes)`, or predicted classes of shape `(batch,)`.
+        :param targets: Target classes of shape `(batch,)`.
+        """
+        if outputs.dim() > 1:
+            if self.num_classes is None:
+                self.num_classes = outputs.shape[1]
+            outputs = outputs.argmax(dim=1)
+        if self.num_classes is None:
+            raise ValueError('`num_classes` is required when updating with predicted classes.')
+        n = self.num_classes
+        if self._matrix is None:
+            self._matrix = torch.zeros(n * n, dtype=torch.long, device=targets.device)
+        self._matrix += torch.bincount(targets.long() * n + outputs.long(), minlength=n * n)
+
+    def state(self):
+        """
+        Return the accumulated (flattened) matrix as a tensor on the device.
+        """
+        if self._matrix is None:
+            return torch.zeros(0, dtype=torch.long)
+        return self._matrix
+
+    def from_state(self, state):
+        if self.num_classes is None or not len(state):
+            return np.zeros((0, 0), dtype=np.int64)
+        return state.numpy().reshape(self.num_classes, self.num_classes)
+
+    def compute(self):
+        """
+        Return the matrix as a NumPy array of shape `(num_classes, num_classes)`.
+        """
+        return self.from_state(self.state().cpu())
+
+
+def scores_from_confusion_matrix(matrix):
+    """
+    Return `accuracy` and per-class `precision` and `recall` arrays of a confusion matrix
+    (rows are targets). Classes never predicted (or never present) get a precision (or recall) of 0.
+    """
+    matrix = np.asarray(matrix)
+    tp = np.diag(matrix).astype(np.float64)
+    predicted = matrix.sum(axis=0)
+    actual = matrix.sum(axis=1)
+    total = matrix.sum()
+    return {
+        'acc': tp.sum() / total if total else 0.0,
+        'precision': np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0),
+        'recall': np.divide(tp, actual, out=np.zeros_like(tp), where=actual > 0),
+    }
+
+
+class ClassificationMetrics(object):
+    """
+    Loss, accuracy, per-class precision/recall and confusion matrix of a classifier, accumulated on
+    the device over a whole epoch. Nothing is copied to the host until `compute`, which waits for
+    the device once.
+
+    ```
+    metrics = ClassificationMetrics()
+    with torch.inference_mode():
+        for x, y in loader:
+            outputs = model(x)
+            metrics.update(outputs, y, criterion(outputs, y))
+    metrics.compute()  # {'loss': ..., 'acc': ..., 'precision': ..., 'recall': ..., 'confusion_matrix': ...}
+    ```
+    """
+
+    def __init__(self, num_classes=None):
+        self.loss = MeanMetric()
+        self.confusion_matrix = ConfusionMatrix(num_classes)
+
+    def reset(self):
+        self.loss.reset()
+        self.confusion_matrix.reset()
+
+    def update(self, outputs, targets, loss=None):
+        """
+        :param outputs: Logits of shape `(batch, num_classes)`, or predicted classes.
+        :param targets: Target classes.
+        :param loss: The mean loss of the batch, weighted by the batch size.
+        """
+        if loss is not None:
+            self.loss.update(loss, len(targets))
+        self.confusion_matrix.update(outputs, targets)
+
+    def compute(self):
+        # The first copy waits for the pending kernels, the second one has nothing left to wait for.
+        loss_state = self.loss.state().cpu()
+        matrix = self.confusion_matrix.from_state(self.confusion_matrix.state().cpu())
+        results = {'loss': self.loss.from_state(loss_state)}
+        results.update(scores_from_confusion_matrix(matrix))
+        results['confusion_matrix'] = matrix
+        return results
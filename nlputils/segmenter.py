@@ -0,0 +1,105 @@
+# coding=utf-8
+import math
+
+# Marks a missing key in the prefix dict, `None` being the value of prefixes that are not words.
+_MISSING = object()
+
+
+class VocabSegmenter(object):
+    """
+    A word segmenter driven by a vocabulary, for languages written without spaces such as Chinese.
+
+    Like jieba without HMM, it builds the DAG of every vocabulary word found in the string with a
+    prefix dict, then takes the route of maximum probability, a word's probability being its count
+    over the total count. Without counts every word counts as one, which favors the route with the
+    fewest words. Characters outside the vocabulary are kept as single-character tokens, except
+    runs of ASCII letters and digits, which are kept together.
+
+    ```
+    segmenter = VocabSegmenter(['北京', '大学', '北京大学'])
+    segmenter.cut('北京大学生')  # ['北京大学', '生']
+    segmenter = VocabSegmenter(['北京', '大学', '北京大学'], counts=[10, 20, 5])
+    segmenter.cut('北京大学生')  # ['北京', '大学', '生']
+    ```
+    """
+
+    def __init__(self, tokens, counts=None, exclude=()):
+        """
+        :param tokens: The vocabulary, a sequence of strings.
+        :param counts: Count of each token, aligned with `tokens`. `None` to count every token as one.
+        :param exclude: Tokens that are never produced, e.g. special tokens.
+        """
+        exclude = set(exclude)
+        freq = {}
+        for i, token in enumerate(tokens):
+            if not token or token in exclude:
+                continue
+            count = int(counts[i]) if counts is not None else 1
+            freq[token] = freq.get(token, 0) + max(count, 1)
+
+        log_total = math.log(sum(freq.values()) or 1)
+        self._prefix_dict = {w: math.log(c) - log_total for w, c in freq.items()}
+        for w in freq:
+            for j in range(1, len(w)):
+                self._prefix_dict.setdefault(w[:j], None)
+        # A character outside the vocabulary is as likely as a word seen once.
+        self._unk_log_prob = -log_total
+
+    def __len__(self):
+        return sum(1 for x in self._prefix_dict.values() if x is not None)
+
+    def __contains__(self, token):
+        return self._prefix_dict.get(token) is not None
+
+    def _route(self, string):
+        """
+        Return `ends`, the route of maximum probability: the word starting at `i` ends at `ends[i]`.
+        """
+        prefix_dict = self._prefix_dict
+        unk_log_prob = self._unk_log_prob
+        n = len(string)
+        scores = [0.0] * (n + 1)
+        ends = [0] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            best_score = unk_log_prob + scores[i + 1]
+            best_end = i + 1
+            j = i + 1
+            while j <= n:
+                log_prob = prefix_dict.get(string[i:j], _MISSING)
+                if log_prob is _MISSING:
+                    break
+                if log_prob is not None and log_prob + scores[j] > best_score:
+                    best_score = log_prob + scores[j]
+                    best_end = j
+                j += 1
+            scores[i] = best_score
+            ends[i] = best_end
+        return ends
+
+    def cut(self, string):
+        """
+        Segment a string.
+
+        :return: A list of tokens.
+        """
+        ends = self._route(string)
+        prefix_dict = self._prefix_dict
+        tokens = []
+        buf_start = None
+        i = 0
+        n = len(string)
+        while i < n:
+            j = ends[i]
+            if j == i + 1 and string[i] < '\x80' and string[i].isalnum() and \
+                    prefix_dict.get(string[i]) is None:
+                if buf_start is None:
+                    buf_start = i
+            else:
+                if buf_start is not None:
+                    tokens.append(string[buf_start:i])
+                    buf_start = None
+                tokens.append(string[i:j])
+            i = j
+        if buf_start is not None:
+            tokens.append(string[buf_start:])
+        return tokens
@@ -0,0 +1,174 @@
+# coding=utf-8
+"""
+A compact binary format for tokenizers, meant to be memory-mapped.
+
+Layout of a file (little-endian):
+
+```
+magic (8 bytes) | header offset (uint64) | header length (uint64) | sections... | header (JSON)
+```
+
+The header holds the tokenizer class, its config, the digest of the vocabulary (see
+`Vocabulary.digest`) and, for every section, its dtype, offset and number of items. Sections
+are 8-byte aligned arrays:
+
+- `vocab_offsets` (int64) and `vocab_blob` (uint8): token `i` is `blob[offsets[i]:offsets[i+1]]`
+  decoded as UTF-8.
+- `vocab_table` (int32): an open addressing (linear probing) hash table of token ids, indexed
+  by `zlib.crc32` of the encoded token, `-1` for empty slots.
+- `stopwords_offsets` and `stopwords_blob`: stopwords, same layout as the vocabulary.
+- `vocab_counts` (int64), optional: the count of each token, weighting the vocabulary segmenter.
+"""
+import json
+import logging
+import mmap
+import struct
+import zlib
+import numpy as np
+from .vocabulary import MappedVocabulary, _digest_tokens
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NLPUTOK\x00'
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct('<8sQQ')
+_ALIGNMENT = 8
+
+
+def _encode_strings(strings):
+    """
+    Encode strings into a (offsets, blob) pair of arrays.
+    """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return offsets, blob
+
+
+def _decode_strings(offsets, blob):
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def _build_hash_table(tokens):
+    """
+    Build the hash table of a vocabulary. Like a `dict`, a duplicated token maps to its last id.
+    """
+    token2id = {t: i for i, t in enumerate(tokens)}
+    size = 1
+    while size < 2 * len(token2id):
+        size <<= 1
+    mask = size - 1
+
+    table = np.full(size, -1, dtype=np.int32)
+    for token, index in token2id.items():
+        slot = zlib.crc32(token.encode('utf-8')) & mask
+        while table[slot] >= 0:
+            slot = (slot + 1) & mask
+        table[slot] = index
+    return table
+
+
+def save_tokenizer(tokenizer, fpath):
+    """
+    Save a tokenizer into `fpath`. The tokenizer must implement `_get_config`.
+    """
+    vocab = tokenizer.get_vocab()
+    vocab_offsets, vocab_blob = _encode_strings(vocab)
+    stopwords_offsets, stopwords_blob = _encode_strings(sorted(getattr(tokenizer, '_stop_words', ())))
+    arrays = {
+        'vocab_offsets': vocab_offsets,
+        'vocab_blob': vocab_blob,
+        'vocab_table': _build_hash_table(vocab),
+        'stopwords_offsets': stopwords_offsets,
+        'stopwords_blob': stopwords_blob,
+    }
+    counts = getattr(tokenizer, '_token_counts', None)
+    if counts is not None:
+        arrays['vocab_counts'] = np.asarray(counts, dtype=np.int64)
+
+    sections = {}
+    with open(fpath, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, 0, 0))
+        for name, array in arrays.items():
+            f.write(b'\x00' * (-f.tell() % _ALIGNMENT))
+            sections[name] = {'dtype': array.dtype.str, 'offset': f.tell(), 'count': len(array)}
+            f.write(array.tobytes())
+
+        header = json.dumps({
+            'format_version': FORMAT_VERSION,
+            'class': type(tokenizer).__name__,
+            'config': tokenizer._get_config(),
+            'vocab_digest': _digest_tokens(vocab),
+            'sections': sections,
+        }).encode('utf-8')
+        header_offset = f.tell()
+        f.write(header)
+        f.seek(0)
+        f.write(_PREFIX.pack(MAGIC, header_offset, len(header)))
+    logger.info('Save tokenizer to {}.'.format(fpath))
+
+
+def is_tokenizer_file(fpath):
+    """
+    Check whether `fpath` was written by `save_tokenizer`.
+    """
+    with open(fpath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def map_file(fpath):
+    """
+    Memory-map a tokenizer file.
+
+    :return: A tuple `(header, arrays)`, `arrays` being read-only NumPy views of the sections.
+    """
+    with open(fpath, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, header_offset, header_length = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('{} is not a tokenizer file.'.format(fpath))
+    header = json.loads(buffer[header_offset:header_offset + header_length].decode('utf-8'))
+    if header['format_version'] > FORMAT_VERSION:
+        raise ValueError('Unsupported tokenizer file version {}.'.format(header['format_version']))
+
+    arrays = {name: np.frombuffer(buffer, dtype=np.dtype(x['dtype']), count=x['count'], offset=x['offset'])
+              for name, x in header['sections'].items()}
+    return header, arrays
+
+
+def map_vocabulary(fpath, unk_token=None):
+    """
+    Memory-map the vocabulary of a tokenizer file.
+    """
+    header, arrays = map_file(fpath)
+    return MappedVocabulary(arrays['vocab_offsets'], arrays['vocab_blob'], arrays['vocab_table'],
+                            unk_token=unk_token, fpath=str(fpath), digest=header.get('vocab_digest'))
+
+
+def load_tokenizer(fpath, classes):
+    """
+    Load a tokenizer saved by `save_tokenizer`. The vocabulary is memory-mapped, not copied.
+
+    :param fpath: Path of the file.
+    :param classes: A `dict` mapping class names to tokenizer classes, which must implement
+        `_from_config` and `_set_vocabulary`.
+    """
+    header, arrays = map_file(fpath)
+    if header['class'] not in classes:
+        raise ValueError('Unknown tokenizer class {}.'.format(header['class']))
+
+    tokenizer = classes[header['class']]._from_config(header['config'])
+    tokenizer._set_vocabulary(MappedVocabulary(arrays['vocab_offsets'], arrays['vocab_blob'],
+                                               arrays['vocab_table'], unk_token=tokenizer._unk_token,
+                                               fpath=str(fpath), digest=header.get('vocab_digest')))
+    if hasattr(tokenizer, '_stop_words'):
+        tokenizer._stop_words = set(_decode_strings(arrays['stopwords_offsets'], arrays['stopwords_blob']))
+        tokenizer._build_stopword_mask()
+    if 'vocab_counts' in arrays:
+        tokenizer._token_counts = arrays['vocab_counts']
+    logger.info('Load tokenizer from {}.'.format(fpath))
+    return tokenizer
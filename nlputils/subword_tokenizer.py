@@ -0,0 +1,354 @@
+# coding=utf-8
+import collections
+import heapq
+import logging
+import re
+from collections.abc import Iterable
+from .tokenizer import Tokenizer, DEFAULT_SPECIAL_TOKENS
+from .vocabulary import Vocabulary
+logger = logging.getLogger(__name__)
+
+# Key of the token ending at a node of the trie, characters are never empty.
+_END = ''
+
+_WORD_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def _build_trie(tokens):
+    root = {}
+    for token, key in tokens:
+        node = root
+        for c in key:
+            node = node.setdefault(c, {})
+        node[_END] = token
+    return root
+
+
+def train_wordpiece(token2tf, vocab_size, continuing_subword_prefix='##', min_frequency=2, reserved=0):
+    """
+    Learn a WordPiece vocabulary from word counts with BPE merges: starting from the characters,
+    the most frequent pair of adjacent symbols is merged until the vocabulary has `vocab_size`
+    tokens. Symbols inside a word carry `continuing_subword_prefix`.
+
+    Pair counts are updated incrementally, only for the words containing the merged pair, and the
+    most frequent pair is taken from a heap with lazy deletion of outdated counts.
+
+    :param token2tf: A `dict` of word counts, e.g. `VocabGenerator.get_token2tf()`.
+    :param vocab_size: Size of the vocabulary, `reserved` included. All characters are kept even
+        if there are more of them.
+    :param continuing_subword_prefix: Prefix of the symbols that do not start a word.
+    :param min_frequency: Pairs occurring less often are not merged.
+    :param reserved: Number of tokens reserved for special tokens.
+    :return: The vocabulary as a list, characters first (most frequent first), then merges in order.
+    """
+    prefix_length = len(continuing_subword_prefix)
+    words = []
+    freqs = []
+    alphabet = collections.Counter()
+    for word, count in token2tf.items():
+        if not word or count <= 0 or word.isspace():
+            continue
+        symbols = [word[0]] + [continuing_subword_prefix + c for c in word[1:]]
+        words.append(symbols)
+        freqs.append(count)
+        for s in symbols:
+            alphabet[s] += count
+
+    vocab = [s for s, _ in sorted(alphabet.items(), key=lambda x: (-x[1], x[0]))]
+    seen = set(vocab)
+
+    pair_counts = collections.defaultdict(int)
+    where = collections.defaultdict(set)
+    for i, symbols in enumerate(words):
+        for pair in zip(symbols, symbols[1:]):
+            pair_counts[pair] += freqs[i]
+            where[pair].add(i)
+    heap = [(-count, pair) for pair, count in pair_counts.items()]
+    heapq.heapify(heap)
+
+    while len(vocab) + reserved < vocab_size and heap:
+        count, pair = heapq.heappop(heap)
+        count = -count
+        if pair_counts.get(pair) != count:
+            # Outdated entry, the current count was pushed when it changed.
+            continue
+        if count < min_frequency:
+            break
+
+        a, b = pair
+        merged = a + b[prefix_length:]
+        if merged not in seen:
+            vocab.append(merged)
+            seen.add(merged)
+
+        changed = set()
+        for i in where.pop(pair):
+            symbols = words[i]
+            freq = freqs[i]
+            new_symbols = []
+            j = 0
+            while j < len(symbols):
+                if j + 1 < len(symbols) and symbols[j] == a and symbols[j + 1] == b:
+                    new_symbols.append(merged)
+                    j += 2
+                else:
+                    new_symbols.append(symbols[j])
+                    j += 1
+            if len(new_symbols) == len(symbols):
+                continue
+
+            for p in zip(symbols, symbols[1:]):
+                pair_counts[p] -= freq
+                changed.add(p)
+            for p in zip(new_symbols, new_symbols[1:]):
+                pair_counts[p] += freq
+                where[p].add(i)
+                changed.add(p)
+            words[i] = new_symbols
+
+        del pair_counts[pair]
+        changed.discard(pair)
+        for p in changed:
+            if pair_counts[p] > 0:
+                heapq.heappush(heap, (-pair_counts[p], p))
+            else:
+                del pair_counts[p]
+    return vocab
+
+
+class SubwordTokenizer(Tokenizer):
+    """
+    A WordPiece tokenizer. Words are split into the longest subwords of the vocabulary, matched
+    greedily from left to right with a prefix trie, subwords inside a word carrying
+    `continuing_subword_prefix`. A word that cannot be split is mapped to `unk_token`.
+
+    The vocabulary is either trained with `train` from word counts, bounding its size whatever
+    the corpus, or loaded with `load_vocab`. It starts with the special tokens.
+
+    ```
+    gen = VocabGenerator()
+    gen.generate_vocab(tokenized_corpus)
+    tokenizer = SubwordTokenizer('en')
+    tokenizer.train(gen.get_token2tf(), vocab_size=30000)
+    tokenizer.tokenize('unaffable')  # ['un', '##aff', '##able']
+    ```
+
+    Supported languages: `cn` (words are segmented by jieba), `en` (words are runs of letters and
+    digits, and single punctuation marks).
+    """
+
+    def __init__(self, language='en', lowercase=False, continuing_subword_prefix='##',
+                 max_input_chars_per_word=100, word_cache_size=100000, **kwargs):
+        """
+        :param language: `cn` or `en`, select how strings are split into words.
+        :param lowercase: Set `True` to lowercase strings before splitting them.
+        :param continuing_subword_prefix: Prefix of the subwords that do not start a word.
+        :param max_input_chars_per_word: Longer words are mapped to `unk_token`.
+        :param word_cache_size: Max number of words whose subwords are memoized.
+        :param kwargs: Special tokens, see `Tokenizer`.
+        """
+        if language not in ['cn', 'en']:
+            raise ValueError(f'Language {language} not supported.')
+        self._language = language
+        self.lowercase = lowercase
+        self.continuing_subword_prefix = continuing_subword_prefix
+        self.max_input_chars_per_word = max_input_chars_per_word
+        self._word_cache_size = word_cache_size
+        super(SubwordTokenizer, self).__init__(**kwargs)
+        self._vocabulary = Vocabulary(unk_token=self._unk_token)
+        self._trie = None
+        self._word_cache = {}
+
+    def _get_special_tokens(self):
+        tokens = [getattr(self, '_' + x) for x in DEFAULT_SPECIAL_TOKENS]
+        return tokens + [x for x in self._additional_special_tokens if x not in tokens]
+
+    def train(self, token2tf, vocab_size, min_frequency=2):
+        """
+        Train a vocabulary of `vocab_size` tokens (special tokens included) from word counts
+        (see `train_wordpiece`), and load it.
+
+        :param token2tf: A `dict` of word counts, e.g. `VocabGenerator.get_token2tf()`.
+        :return: The vocabulary as a list.
+        """
+        if self.lowercase:
+            counts = collections.Counter()
+            for word, count in token2tf.items():
+                counts[word.lower()] += count
+            token2tf = counts
+        special_tokens = self._get_special_tokens()
+        vocab = train_wordpiece(token2tf, vocab_size, self.continuing_subword_prefix, min_frequency,
+                                reserved=len(special_tokens))
+        logger.info('Train a vocabulary of {} subwords from {} words.'.format(
+            len(vocab) + len(special_tokens), len(token2tf)))
+        reserved = set(special_tokens)
+        return self.load_vocab(special_tokens + [x for x in vocab if x not in reserved])
+
+    def load_vocab(self, src):
+        """
+        Load vocab from either a Iterable object or a file path. Ids (integer) are
+        generated using `range(len(vocab))`.
+        """
+        if not isinstance(src, (Iterable, str)):
+            raise ValueError(
+                'Vocab can only be loaded from Iterable or file path.')
+
+        if isinstance(src, str):
+            with open(src, 'r', encoding='utf-8') as f:
+                vocab = [x.strip() for x in f]
+            logger.info('Load vocabulary from {}.'.format(src))
+        else:
+            vocab = list(src)
+
+        self._set_vocabulary(Vocabulary(vocab, unk_token=self._unk_token))
+        return self.get_vocab()
+
+    def _set_vocabulary(self, vocabulary):
+        self._vocabulary = vocabulary
+        self._trie = None
+        self._word_cache = {}
+
+    def _get_trie(self):
+        """
+        Return the tries of the subwords starting a word and of the other subwords (without
+        `continuing_subword_prefix`), built on first use.
+        """
+        if self._trie is None:
+            prefix = self.continuing_subword_prefix
+            special_tokens = set(self._get_special_tokens())
+            starts = []
+            continuations = []
+            for token in self._vocabulary.get_tokens():
+                if not token or token in special_tokens:
+                    continue
+                if prefix and token.startswith(prefix) and len(token) > len(prefix):
+                    continuations.append((token, token[len(prefix):]))
+                else:
+                    starts.append((token, token))
+            self._trie = (_build_trie(starts), _build_trie(continuations))
+        return self._trie
+
+    def _split_words(self, string):
+        if self.lowercase:
+            string = string.lower()
+        if self._language == 'cn':
+            import jieba
+            return [w for w in jieba.cut(string) if not w.isspace()]
+        return _WORD_PATTERN.findall(string)
+
+    def _tokenize_word(self, word):
+        """
+        Split a word into subwords by greedy longest match.
+
+        :return: A tuple of subwords.
+        """
+        if len(word) > self.max_input_chars_per_word:
+            return self._unk_token,
+        start_trie, continuation_trie = self._get_trie()
+        pieces = []
+        start = 0
+        n = len(word)
+        while start < n:
+            node = start_trie if start == 0 else continuation_trie
+            end = None
+            k = start
+            while k < n:
+                node = node.get(word[k])
+                if node is None:
+                    break
+                k += 1
+                token = node.get(_END)
+                if token is not None:
+                    end = k
+                    piece = token
+            if end is None:
+                return self._unk_token,
+            pieces.append(piece)
+            start = end
+        return tuple(pieces)
+
+    def tokenize(self, string):
+        """
+        Tokenize a string into subwords.
+        """
+        with self._stage('segment'):
+            cache = self._word_cache
+            tokens = []
+            for word in self._split_words(string):
+                pieces = cache.get(word)
+                if pieces is None:
+                    pieces = self._tokenize_word(word)
+                    if len(cache) < self._word_cache_size:
+                        cache[word] = pieces
+                tokens.extend(pieces)
+        return tokens
+
+    def _convert_token_to_id(self, token):
+        return self._vocabulary.token_to_id(token)
+
+    def _convert_id_to_token(self, index):
+        return self._vocabulary.id_to_token(index)
+
+    def convert_tokens_to_ids(self, tokens):
+        """
+        Convert a list of tokens to a list of ids. Tokens that are not in the vocabulary
+        would be replaced by `self._unk_token`.
+        """
+        with self._stage('convert'):
+            ids = self._vocabulary.tokens_to_ids(tokens)
+        if self._stats is not None:
+            self._stats.count('tokens', len(ids))
+            self._stats.count('unk', ids.count(self._vocabulary.unk_id))
+        return ids
+
+    def convert_ids_to_tokens(self, ids):
+        """
+        Convert a list (or a NumPy array) of ids to a list of tokens.
+        """
+        return self._vocabulary.ids_to_tokens(ids).tolist()
+
+    def convert_tokens_to_string(self, tokens):
+        """
+        Join subwords back into a string, words being separated by a space for `en`.
+        """
+        prefix = self.continuing_subword_prefix
+        separator = '' if self._language == 'cn' else ' '
+        words = []
+        for token in tokens:
+            if words and prefix and token.startswith(prefix) and len(token) > len(prefix):
+                words[-1] += token[len(prefix):]
+            else:
+                words.append(token)
+        return separator.join(words)
+
+    def decode(self, ids):
+        """
+        Decode a list of ids into a string.
+        """
+        return self.convert_tokens_to_string(self.convert_ids_to_tokens(ids))
+
+    def _get_config(self):
+        config = {'language': self._language, 'lowercase': self.lowercase,
+                  'continuing_subword_prefix': self.continuing_subword_prefix,
+                  'max_input_chars_per_word': self.max_input_chars_per_word}
+        for key in self._SPECIAL_TOKENS_ATTRIBUTES:
+            config[key] = getattr(self, '_' + key)
+        return config
+
+    def get_vocab(self):
+        """
+        Return the vocabulary as a list.
+        """
+        return self._vocabulary.get_tokens()
+
+    def get_token2id(self):
+        return self._vocabulary.get_token2id()
+
+    def get_id2token(self):
+        return self._vocabulary.get_id2token()
+
+    def get_vocabulary(self):
+        """
+        Return the `Vocabulary` object behind the tokenizer.
+        """
+        return self._vocabulary
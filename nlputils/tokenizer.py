@@ -1,15 +1,24 @@
 # coding=utf-8
-import jieba
-from tqdm import tqdm
-import spacy
-import pickle
+# `jieba`, `spacy` and `pickle` are imported on first use, so that importing the package
+# doesn't pay for backends that are never used.
 import numpy as np
+import array
 import collections
-from collections.abc import Iterable
+import hashlib
+import json
+from collections.abc import Iterable, Sized
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 import logging
+import os
 from pathlib import Path
 from . import STOPWORDS_PATH_DICT
+from .vocabulary import Vocabulary, _digest_tokens
+from .cache import LRUCache
+from .segmenter import VocabSegmenter
+from .instrumentation import PipelineStats, NULL_STAGE
+from .serialization import save_tokenizer, load_tokenizer, is_tokenizer_file
 logger = logging.getLogger(__name__)
 
 
@@ -58,6 +67,120 @@ def pad_sequence_to_fixed_length(sequence, max_length, value=0, padding_mode='ri
             return paddings + sequence
 
 
+def pad_sequences(sequences, max_length=None, value=0, padding_mode='right', truncate_mode='right',
+                  dtype='int32', offsets=None):
+    """
+    Pad a batch of sequences using `value` into one preallocated NumPy array. Row `i` is the same
+    as `pad_sequence_to_fixed_length(sequences[i], ...)`, but no list is built per sequence.
+
+    Sequences are given either as a list of Iterables, or as a flat array of values plus `offsets`,
+    sequence `i` being `sequences[offsets[i]:offsets[i+1]]`.
+
+    :param sequences: A list of Iterables, or a flat array if `offsets` is given.
+    :param max_length: Max length to pad. `None` to pad to the longest sequence.
+    :param value: Value for padding.
+    :param padding_mode: Specify which side to pad. Either `right` or `left`.
+    :param truncate_mode: Which side to truncate.
+    :param dtype: Data type of the array.
+    :param offsets: Offsets of the sequences in the flat array `sequences`, of length `n + 1`.
+    :return: An array of shape `(n, max_length)`.
+    """
+    supported_mode = ['right', 'left']
+    assert padding_mode in supported_mode and truncate_mode in supported_mode
+
+    if offsets is None:
+        sequences = list(sequences)
+        lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+        flat = np.fromiter(chain.from_iterable(sequences), dtype=dtype, count=int(lengths.sum()))
+        starts = np.cumsum(lengths) - lengths
+    else:
+        flat = np.asarray(sequences)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        starts = offsets[:-1]
+        lengths = np.diff(offsets)
+
+    if max_length is None:
+        max_length = int(lengths.max(initial=0))
+    return _pad_flat(flat, starts, lengths, max_length, value, padding_mode, truncate_mode, dtype)
+
+
+def _pad_flat(flat, starts, lengths, max_length, value, padding_mode, truncate_mode, dtype):
+    """
+    Copy the sequences `flat[starts[i]:starts[i]+lengths[i]]` into a padded array, with one
+    vectorized scatter instead of a loop over the sequences.
+    """
+    kept = np.minimum(lengths, max_length)
+    src = starts + (lengths - kept if truncate_mode == 'left' else 0)
+    dst = max_length - kept if padding_mode == 'left' else np.zeros_like(kept)
+
+    out = np.full((len(lengths), max_length), value, dtype=dtype)
+    rows = np.repeat(np.arange(len(lengths)), kept)
+    # Position of every copied value inside its own sequence.
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(kept) - kept, kept)
+    out[rows, np.repeat(dst, kept) + within] = flat[np.repeat(src, kept) + within]
+    return out
+
+
+def _attention_mask(lengths, max_length, padding_mode):
+    """
+    Return the int32 attention mask of a batch padded to `max_length`, `1` for non-padding positions.
+    """
+    positions = np.arange(max_length, dtype=np.int32)
+    if padding_mode == 'right':
+        attention_mask = positions < lengths[:, None]
+    else:
+        attention_mask = positions >= (max_length - lengths)[:, None]
+    return attention_mask.astype(np.int32)
+
+
+def filter_ids(ids, offsets, mask):
+    """
+    Drop the ids flagged by a boolean `mask` over the vocabulary from a batch of sequences stored as
+    flat ids plus offsets, in one vectorized operation.
+
+    :param ids: Flat array of ids.
+    :param offsets: Offsets of the sequences, sequence `i` being `ids[offsets[i]:offsets[i+1]]`.
+    :param mask: Boolean array indexed by id, `True` for ids to drop.
+    :return: A tuple `(ids, offsets)`.
+    """
+    ids = np.asarray(ids)
+    keep = ~mask[ids]
+    kept_before = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(keep, out=kept_before[1:])
+    return ids[keep], kept_before[np.asarray(offsets)]
+
+
+def _iter_chunks(iterable, chunk_size):
+    """
+    Split a Iterable into lists of `chunk_size` elements, the last one may be shorter.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_subclasses(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _iter_subclasses(subclass)
+
+
+# The tokenizer owned by a worker process of `Tokenizer.tokenize_corpus`.
+_worker_tokenizer = None
+
+
+def _init_tokenize_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _tokenize_chunk(chunk, kwargs):
+    return [_worker_tokenizer.tokenize(s, **kwargs) for s in chunk]
+
+
 class Tokenizer(object):
     """
     A abstract class for tokenizer. Behaviors such as tokenization and token-id mapping can be customized to fit
@@ -114,6 +237,7 @@ class Tokenizer(object):
         self._cls_token = DEFAULT_SPECIAL_TOKENS["cls_token"]
         self._mask_token = DEFAULT_SPECIAL_TOKENS["mask_token"]
         self._additional_special_tokens = []
+        self._stats = None
 
         self._vocab = []
         self._ids = []
@@ -163,12 +287,108 @@ class Tokenizer(object):
         """
         raise NotImplementedError
 
+    def tokenize_corpus(self, corpus, no_stop_words=False, workers=None, chunk_size=1000, max_pending=None):
+        """
+        Tokenize a (possibly unbounded) Iterable of strings with a pool of processes.
+
+        Strings are sent to the workers by chunks of `chunk_size`, and at most `max_pending`
+        chunks are in flight at any time, so memory stays flat whatever the size of `corpus`.
+        Results are yielded in input order.
+
+        :param corpus: A Iterable of strings.
+        :param no_stop_words: Set `True` to remove stop words from the strings, for tokenizers that have them.
+        :param workers: Number of processes. `None` to use all cores, `1` to tokenize in the current process.
+        :param chunk_size: Number of strings sent to a worker at a time.
+        :param max_pending: Max number of chunks in flight. Default to `2 * workers`.
+        :return: A generator of token lists.
+        """
+        kwargs = {}
+        if no_stop_words:
+            if not hasattr(self, '_stop_words'):
+                raise ValueError('{} does not remove stop words.'.format(type(self).__name__))
+            kwargs['no_stop_words'] = True
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1:
+            for string in corpus:
+                yield self.tokenize(string, **kwargs)
+            return
+
+        self._prepare_workers()
+        max_pending = max_pending or 2 * workers
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_tokenize_worker,
+                                 initargs=(self,)) as executor:
+            pending = collections.deque()
+            for chunk in _iter_chunks(corpus, chunk_size):
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+                pending.append(executor.submit(_tokenize_chunk, chunk, kwargs))
+            while pending:
+                yield from pending.popleft().result()
+
+    def _prepare_workers(self):
+        """
+        Called by `tokenize_corpus` before starting its workers, e.g. to load what forked workers inherit.
+        """
+        pass
+
     def save_to(self, fpath):
         """
-        Save the tokenizer object as pickle file.
+        Save the tokenizer into a compact binary file, which `load_from` memory-maps.
+        See `serialization.py` for the format.
+        """
+        save_tokenizer(self, fpath)
+
+    @classmethod
+    def load_from(cls, fpath):
+        """
+        Load a tokenizer saved by `save_to`. The vocabulary is memory-mapped rather than copied,
+        so processes loading the same file (e.g. `DataLoader` workers) share its pages.
+        Pickle files written by older versions are still accepted.
         """
-        with open(fpath, 'wb') as f:
-            pickle.dump(self, f)
+        if not is_tokenizer_file(fpath):
+            import pickle
+            with open(fpath, 'rb') as f:
+                return pickle.load(f)
+        return load_tokenizer(fpath, {c.__name__: c for c in _iter_subclasses(Tokenizer)})
+
+    def _get_config(self):
+        """
+        Return the arguments needed to rebuild the tokenizer, as a JSON serializable `dict`.
+        """
+        raise NotImplementedError
+
+    def fingerprint(self, stopwords=True):
+        """
+        Return a SHA-256 hex digest of everything that affects the output of the tokenizer:
+        its class, config, vocabulary, token counts and stopwords.
+
+        :param stopwords: Set `False` to leave the stopwords out, when they are not removed and
+            thus do not affect the output.
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps({'class': type(self).__name__, 'config': self._get_config()},
+                            sort_keys=True).encode('utf-8'))
+        # The digest of a vocabulary is computed once, or read from the file it was loaded from.
+        vocabulary = getattr(self, '_vocabulary', None)
+        vocab_digest = vocabulary.digest() if vocabulary is not None else _digest_tokens(self.get_vocab())
+        h.update(vocab_digest.encode('utf-8'))
+        stop_words = sorted(getattr(self, '_stop_words', ())) if stopwords else []
+        h.update(_digest_tokens(stop_words).encode('utf-8'))
+        counts = getattr(self, '_token_counts', None)
+        if counts is not None:
+            h.update(np.ascontiguousarray(counts, dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    @classmethod
+    def _from_config(cls, config):
+        return cls(**config)
+
+    def _set_vocabulary(self, vocabulary):
+        """
+        Set a `Vocabulary` (or `MappedVocabulary`) as the vocabulary of the tokenizer.
+        """
+        raise NotImplementedError
 
     def load_vocab(self, src):
         """
@@ -197,6 +417,57 @@ class Tokenizer(object):
                 padding_mode, truncate_mode)
         return ids
 
+    def batch_encode(self, strings, max_length=None, padding_mode='right', truncate_mode='right', **kwargs):
+        """
+        Encode a batch of strings into a padded matrix of ids. Ids are written straight into a
+        preallocated int32 matrix, no padded list is built for any sample.
+
+        :param strings: A Iterable of strings.
+        :param max_length: Number of columns of the matrix. `None` to pad to the longest sample.
+        :param padding_mode: Specify which side to pad. Either `right` or `left`.
+        :param truncate_mode: Which side to truncate.
+        :param kwargs: Passed to `self.tokenize`.
+        :return: A tuple `(ids, lengths, attention_mask)`. `ids` and `attention_mask` are int32
+            arrays of shape `(len(strings), max_length)`, `lengths` holds the number of non-padding
+            ids of each row.
+        """
+        supported_mode = ['right', 'left']
+        assert padding_mode in supported_mode and truncate_mode in supported_mode
+
+        samples = (self.tokenize(s, **kwargs) for s in strings)
+        if max_length is None:
+            samples = list(samples)
+            max_length = max((len(x) for x in samples), default=0)
+        elif not isinstance(strings, Sized):
+            samples = list(samples)
+
+        n = len(samples) if isinstance(samples, list) else len(strings)
+        with self._stage('pad'):
+            ids = np.full((n, max_length), self._convert_token_to_id(self._pad_token), dtype=np.int32)
+        lengths = np.empty(n, dtype=np.int32)
+        truncated = 0
+        for i, tokens in enumerate(samples):
+            length = min(len(tokens), max_length)
+            truncated += length < len(tokens)
+            if truncate_mode == 'right':
+                tokens = tokens[:length]
+            else:
+                tokens = tokens[len(tokens)-length:]
+
+            row_ids = self.convert_tokens_to_ids(tokens)
+            with self._stage('pad'):
+                if padding_mode == 'right':
+                    ids[i, :length] = row_ids
+                else:
+                    ids[i, max_length-length:] = row_ids
+            lengths[i] = length
+
+        self._count('sequences', n)
+        self._count('truncated', truncated)
+        with self._stage('pad'):
+            attention_mask = _attention_mask(lengths, max_length, padding_mode)
+        return ids, lengths, attention_mask
+
     def decode(self, ids):
         """
         Decode a list of ids into a string.
@@ -227,6 +498,39 @@ class Tokenizer(object):
     def get_all_special_tokens(self):
         return [getattr(self, '_' + x) for x in self._SPECIAL_TOKENS_ATTRIBUTES]
 
+    def enable_instrumentation(self, callback=None):
+        """
+        Record the cumulative time and number of calls of every stage of the pipeline (`segment`,
+        `stopwords`, `convert`, `pad`), and count `tokens`, `unk`, `sequences` and `truncated`
+        sequences. Stages running in worker processes (`tokenize_corpus`) are not recorded.
+
+        :param callback: Called with `(stage, seconds)` every time a stage completes.
+        """
+        self._stats = PipelineStats(callback)
+
+    def disable_instrumentation(self):
+        self._stats = None
+
+    def get_stats(self):
+        """
+        Return a snapshot of the recorded statistics as a `dict`, or `None` if instrumentation is disabled.
+        """
+        if self._stats is None:
+            return None
+        snapshot = self._stats.snapshot()
+        counters = snapshot['counters']
+        snapshot['unk_rate'] = counters.get('unk', 0) / counters['tokens'] if counters.get('tokens') else 0.0
+        return snapshot
+
+    def _stage(self, name):
+        if self._stats is None:
+            return NULL_STAGE
+        return self._stats.stage(name)
+
+    def _count(self, name, n=1):
+        if self._stats is not None:
+            self._stats.count(name, n)
+
 
 class BasicTokenizer(Tokenizer):
     """
@@ -237,26 +541,85 @@ class BasicTokenizer(Tokenizer):
     Supported languages: `cn`, `en`   
     """
 
-    def __init__(self, language='cn', norm=False, merge_ne=False, **kwargs):
+    def __init__(self, language='cn', norm=False, merge_ne=False, lazy_load=False, stopword_level='token',
+                 segmenter='jieba', **kwargs):
         """
-        `lemma` and 'merge_ne' only valid for `en`.
+        `lemma` and 'merge_ne' only valid for `en`. Set `lazy_load` to `True` to load the
+        spaCy model on first use rather than now.
+
+        For `cn`, `segmenter='vocab'` segments with the loaded vocabulary (see `VocabSegmenter`) rather
+        than jieba's dictionary, so that every segment but unknown characters is in the vocabulary.
+        Words are weighted by the `token2tf` counts given to `load_vocab`.
+
+        With `stopword_level='id'`, `encode` and `batch_encode` drop stopwords after id conversion with
+        a boolean mask over the vocabulary, built when the vocabulary or the stopwords are loaded.
+        Stopwords that are not in the vocabulary are then kept, as `unk_token`.
         """
         self._SUPPORTED_LANGUAGE = {'cn', 'en'}
         if language not in self._SUPPORTED_LANGUAGE:
             raise ValueError(f'Language {language} not supported.')
-
-        if language == 'en':
-            self.norm = norm
-            self.model = spacy.load('en_core_web_sm')
-            if merge_ne:
-                # Merge name entities.
-                merge_ents = self.model.create_pipe("merge_entities")
-                self.model.add_pipe(merge_ents)
+        if stopword_level not in ['token', 'id']:
+            raise ValueError(f'Stopword level {stopword_level} not supported.')
+        if segmenter not in ['jieba', 'vocab'] or (segmenter == 'vocab' and language != 'cn'):
+            raise ValueError(f'Segmenter {segmenter} not supported for language {language}.')
+        self._stopword_level = stopword_level
+        self._segmenter_name = segmenter
+        self._segmenter = None
+        self._token_counts = None
+
+        self.norm = norm
+        self._merge_ne = merge_ne
+        self._model = None
+        if language == 'en' and not lazy_load:
+            self._load_model()
 
         self._stop_words = self._init_stop_words(language)
         self._language = language
         super(BasicTokenizer, self).__init__(**kwargs)
+        self._vocabulary = Vocabulary(unk_token=self._unk_token)
+        self._stopword_mask = np.zeros(0, dtype=bool)
+        self._cache = None
     
+    @property
+    def segmenter(self):
+        """
+        The `VocabSegmenter` of the vocabulary, built on first access.
+        """
+        if self._segmenter is None:
+            special_tokens = [getattr(self, '_' + x) for x in self._SPECIAL_TOKENS_ATTRIBUTES
+                              if x != 'additional_special_tokens']
+            self._segmenter = VocabSegmenter(self._vocabulary.get_tokens(), self._token_counts,
+                                             exclude=special_tokens + list(self._additional_special_tokens))
+        return self._segmenter
+
+    @property
+    def model(self):
+        """
+        The spaCy model, loaded on first access.
+        """
+        if self._model is None:
+            self._load_model()
+        return self._model
+
+    def _load_model(self):
+        import spacy
+        model = spacy.load('en_core_web_sm')
+        if self._merge_ne:
+            # Merge name entities. spaCy v3 adds components by name, v2 takes the component itself.
+            if int(spacy.__version__.split('.')[0]) >= 3:
+                model.add_pipe('merge_entities')
+            else:
+                model.add_pipe(model.create_pipe('merge_entities'))
+        self._set_model(model)
+        logger.info('Load spaCy model en_core_web_sm.')
+
+    def _set_model(self, model):
+        self._model = model
+        # Only the tokenizer is needed for `text` and `norm_`, the NER is kept for merging
+        # name entities. The other components are skipped when tokenizing.
+        needed_pipes = {'ner', 'merge_entities'} if self._merge_ne else set()
+        self._disabled_pipes = [x for x in model.pipe_names if x not in needed_pipes]
+
     def _init_stop_words(self, language):
         fpath = Path(__file__).parent / STOPWORDS_PATH_DICT[language]
         with open(fpath, 'r', encoding='utf-8') as f:
@@ -265,36 +628,80 @@ class BasicTokenizer(Tokenizer):
         return stop_words
 
     def _convert_token_to_id(self, token):
-        return self._token2id[token]
+        return self._vocabulary.token_to_id(token)
 
     def _convert_id_to_token(self, index):
-        return self._id2token[index]
+        return self._vocabulary.id_to_token(index)
 
     def convert_tokens_to_ids(self, tokens):
         """
         Convert a list of tokens to a list of ids. Words that are not in the vocabulary
         would be replaced by `self._unk_token`. Return a list with the same length.
         """
-        tokens_ = []
-        for t in tokens:
-            if t not in self._vocab:
-                tokens_.append(self._unk_token)
-            else:
-                tokens_.append(t)
-
-        return [self._convert_token_to_id(t) for t in tokens_]
+        with self._stage('convert'):
+            ids = self._vocabulary.tokens_to_ids(tokens)
+        if self._stats is not None:
+            self._stats.count('tokens', len(ids))
+            self._stats.count('unk', ids.count(self._vocabulary.unk_id))
+        return ids
 
     def convert_ids_to_tokens(self, ids):
-        ids_ = []
-        for i in ids:
-            if i not in self._ids:
-                ids_.append(self._token2id[self._unk_token])
-            else:
-                ids_.append(i)
-        return [self._convert_id_to_token(i) for i in ids]
+        """
+        Convert a list (or a NumPy array) of ids to a list of tokens. Ids that are not in
+        the vocabulary would be replaced by `self._unk_token`.
+        """
+        return self._vocabulary.ids_to_tokens(ids).tolist()
 
     def discard_stop_words(self, tokens):
-        return [t for t in tokens if t not in self._stop_words]
+        with self._stage('stopwords'):
+            return [t for t in tokens if t not in self._stop_words]
+
+    def _build_stopword_mask(self):
+        mask = np.zeros(len(self._vocabulary), dtype=bool)
+        for t in self._stop_words:
+            if t in self._vocabulary:
+                mask[self._vocabulary.token_to_id(t)] = True
+        self._stopword_mask = mask
+
+    def get_stopword_mask(self):
+        """
+        Return a boolean array indexed by id, `True` for the ids of stopwords.
+        """
+        return self._stopword_mask
+
+    def discard_stop_ids(self, ids):
+        """
+        Remove the ids of stopwords from an array of ids, with the precomputed stopword mask.
+        """
+        with self._stage('stopwords'):
+            ids = np.asarray(ids, dtype=np.int64)
+            return ids[~self._stopword_mask[ids]]
+
+    def enable_cache(self, max_entries=100000, max_bytes=None):
+        """
+        Memoize `tokenize` (and therefore `encode`) in a LRU cache keyed on the string, `no_stop_words`
+        and `norm`. The cache is cleared whenever `load_vocab` or `load_stopwords` is called.
+
+        :param max_entries: Max number of cached strings. `None` for no limit.
+        :param max_bytes: Max estimated memory used by the cache. `None` for no limit.
+        """
+        self._cache = LRUCache(max_entries, max_bytes)
+
+    def disable_cache(self):
+        self._cache = None
+
+    def get_cache_stats(self):
+        """
+        Return a `dict` of hits, misses, evictions and hit rate of the cache, or `None`
+        if the cache is disabled.
+        """
+        if self._cache is None:
+            return None
+        return self._cache.get_stats()
+
+    def _clear_cache(self):
+        if self._cache is not None:
+            self._cache.clear()
 
     def tokenize(self, string, no_stop_words=False):
         """
@@ -304,19 +711,79 @@ class BasicTokenizer(Tokenizer):
         :param no_stop_words: Set `True` to remove stop words from the string.
         :return:
         """
-        if self._language == 'cn':
-            tokens = list(jieba.cut(string))
+        if self._cache is None:
+            return self._tokenize(string, no_stop_words)
 
-        elif self._language == 'en':
-            if self.norm is True:
-                tokens = [t.norm_ for t in self.model(string)]
-            else:
-                tokens = [t.text for t in self.model(string)]
+        key = (string, no_stop_words, self.norm)
+        tokens = self._cache.get(key)
+        if tokens is None:
+            tokens = tuple(self._tokenize(string, no_stop_words))
+            self._cache.put(key, tokens)
+        return list(tokens)
+
+    def _tokenize(self, string, no_stop_words):
+        with self._stage('segment'):
+            if self._language == 'cn':
+                if self._segmenter_name == 'vocab':
+                    tokens = self.segmenter.cut(string)
+                else:
+                    import jieba
+                    tokens = list(jieba.cut(string))
+
+            elif self._language == 'en':
+                tokens = self._doc_to_tokens(self.model(string, disable=self._disabled_pipes))
 
         if no_stop_words:
             tokens = self.discard_stop_words(tokens)
         return tokens
 
+    def _doc_to_tokens(self, doc):
+        if self.norm is True:
+            return [t.norm_ for t in doc]
+        return [t.text for t in doc]
+
+    def pipe(self, strings, no_stop_words=False, batch_size=1000, n_process=1):
+        """
+        Tokenize English strings in batches with spaCy's `nlp.pipe`. Pipeline components that
+        are not needed by the tokenizer (all of them unless `merge_ne` is set) are disabled.
+
+        :param strings: A Iterable of strings.
+        :param no_stop_words: Set `True` to remove stop words from the strings.
+        :param batch_size: Number of strings processed by spaCy at a time.
+        :param n_process: Number of processes used by spaCy.
+        :return: A generator of token lists.
+        """
+        if self._language != 'en':
+            raise ValueError('`pipe` is only supported for language `en`.')
+
+        docs = self.model.pipe(strings, batch_size=batch_size, n_process=n_process,
+                               disable=self._disabled_pipes)
+        for doc in docs:
+            tokens = self._doc_to_tokens(doc)
+            if no_stop_words:
+                tokens = self.discard_stop_words(tokens)
+            yield tokens
+
+    def tokenize_corpus(self, corpus, no_stop_words=False, workers=None, chunk_size=1000, max_pending=None):
+        """
+        Tokenize a (possibly unbounded) Iterable of strings with a pool of processes, see
+        `Tokenizer.tokenize_corpus`. For `en`, this is done by `self.pipe` with `n_process=workers`
+        and `batch_size=chunk_size`.
+        """
+        if self._language == 'en':
+            if workers is None:
+                workers = os.cpu_count() or 1
+            return self.pipe(corpus, no_stop_words, batch_size=chunk_size, n_process=workers)
+        return super(BasicTokenizer, self).tokenize_corpus(corpus, no_stop_words, workers, chunk_size, max_pending)
+
+    def _prepare_workers(self):
+        # Build the prefix dict once, forked workers inherit it.
+        if self._segmenter_name == 'vocab':
+            self.segmenter
+        else:
+            import jieba
+            jieba.initialize()
+
     def encode(self, string, max_length=None, padding_mode='right', truncate_mode='right', no_stop_words=False):
         """
         Encode a string into a list of ids.
@@ -330,18 +797,63 @@ class BasicTokenizer(Tokenizer):
         :param truncate_mode: Which side to truncate.
         :return: A list of ids.
         """
-        tokens = self.tokenize(string, no_stop_words)
-        ids = self.convert_tokens_to_ids(tokens)
+        if no_stop_words and self._stopword_level == 'id':
+            ids = self.discard_stop_ids(self.convert_tokens_to_ids(self.tokenize(string))).tolist()
+        else:
+            ids = self.convert_tokens_to_ids(self.tokenize(string, no_stop_words))
+        self._count('sequences')
         if max_length is not None:
-            ids = pad_sequence_to_fixed_length(
-                ids, max_length, self._convert_token_to_id(self._pad_token),
-                padding_mode, truncate_mode)
+            if len(ids) > max_length:
+                self._count('truncated')
+            with self._stage('pad'):
+                ids = pad_sequence_to_fixed_length(
+                    ids, max_length, self._convert_token_to_id(self._pad_token),
+                    padding_mode, truncate_mode)
         return ids
 
-    def load_vocab(self, src):
+    def batch_encode(self, strings, max_length=None, padding_mode='right', truncate_mode='right',
+                     no_stop_words=False):
+        """
+        Encode a batch of strings into a padded int32 matrix of ids.
+
+        :param strings: A Iterable of strings.
+        :param max_length: Number of columns of the matrix. `None` to pad to the longest sample.
+        :param padding_mode: Specify which side to pad. Either `right` or `left`.
+        :param truncate_mode: Which side to truncate.
+        :param no_stop_words: Set `True` to remove stop words from the strings.
+        :return: A tuple `(ids, lengths, attention_mask)`.
+        """
+        if not (no_stop_words and self._stopword_level == 'id'):
+            return super(BasicTokenizer, self).batch_encode(strings, max_length, padding_mode, truncate_mode,
+                                                            no_stop_words=no_stop_words)
+
+        # Convert the whole batch to flat ids, then drop the stopwords at once with the mask.
+        flat = array.array('i')
+        offsets = array.array('q', [0])
+        for string in strings:
+            flat.extend(self.convert_tokens_to_ids(self.tokenize(string)))
+            offsets.append(len(flat))
+        flat, offsets = filter_ids(np.frombuffer(flat, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64),
+                                   self._stopword_mask)
+
+        lengths = np.diff(offsets)
+        if max_length is None:
+            max_length = int(lengths.max(initial=0))
+        self._count('sequences', len(lengths))
+        self._count('truncated', int((lengths > max_length).sum()))
+        with self._stage('pad'):
+            ids = pad_sequences(flat, max_length, self._convert_token_to_id(self._pad_token), padding_mode,
+                                truncate_mode, np.int32, offsets)
+        lengths = np.minimum(lengths, max_length).astype(np.int32)
+        return ids, lengths, _attention_mask(lengths, max_length, padding_mode)
+
+    def load_vocab(self, src, token2tf=None):
         """
         Load vocab from either a Iterable object or a file path. Ids (integer) are
-        generated using `range(len(self._vocab))`.
+        generated using `range(len(vocab))`.
+
+        `token2tf`, a `dict` of token counts such as `VocabGenerator.get_token2tf()`, weights the
+        words of the `vocab` segmenter. It is saved along with the vocabulary by `save_to`.
         """
         if not isinstance(src, (Iterable, str)):
             raise ValueError(
@@ -349,22 +861,83 @@ class BasicTokenizer(Tokenizer):
 
         if isinstance(src, str):
             with open(src, 'r', encoding='utf-8') as f:
-                self._vocab = [x.strip() for x in f.readlines()]
+                vocab = [x.strip() for x in f]
             logger.info('Load vocabulary from {}.'.format(src))
 
         else:
-            self._vocab = list(src)
+            vocab = list(src)
 
-        # Assign id (integer) for each token in the vocabulary.
-        self._ids = [i for i in range(len(self._vocab))]
-        self._token2id = {self._vocab[i]: i for i in self._ids}
-        self._id2token = {value: key for key, value in self._token2id.items()}
+        self._token_counts = None
+        if token2tf is not None:
+            self._token_counts = np.array([token2tf.get(t, 0) for t in vocab], dtype=np.int64)
 
-        # Cast vocab and ids to set().
-        # self._vocab = set(self._vocab)
-        # self._ids = set(self._ids)
+        # Assign id (integer) for each token in the vocabulary.
+        self._set_vocabulary(Vocabulary(vocab, unk_token=self._unk_token))
         return self.get_vocab()
 
+    def _set_vocabulary(self, vocabulary):
+        self._vocabulary = vocabulary
+        self._segmenter = None
+        self._build_stopword_mask()
+        self._clear_cache()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_vocabulary' in state:
+            return
+        # A pickle written before `Vocabulary`: fill the attributes added since, with their defaults.
+        model = self.__dict__.pop('model', None)
+        self.__dict__.setdefault('norm', False)
+        self._merge_ne = model is not None and 'merge_entities' in model.pipe_names
+        self._model = None
+        if model is not None:
+            self._set_model(model)
+        self._stopword_level = 'token'
+        self._segmenter_name = 'jieba'
+        self._segmenter = None
+        self._token_counts = None
+        self._stats = None
+        self._cache = None
+        self._set_vocabulary(Vocabulary(self._vocab, unk_token=self._unk_token) if self._vocab
+                             else Vocabulary(unk_token=self._unk_token))
+
+    def _get_config(self):
+        config = {'language': self._language, 'norm': self.norm, 'merge_ne': self._merge_ne,
+                  'stopword_level': self._stopword_level, 'segmenter': self._segmenter_name}
+        for key in self._SPECIAL_TOKENS_ATTRIBUTES:
+            config[key] = getattr(self, '_' + key)
+        return config
+
+    @classmethod
+    def _from_config(cls, config):
+        # The spaCy model is not saved, load it on first use to keep loading fast.
+        return cls(lazy_load=True, **config)
+
+    def get_vocab(self):
+        """
+        Return the vocabulary as a list.
+        """
+        return self._vocabulary.get_tokens()
+
+    def get_token2id(self):
+        """
+        Return a `dict`.
+        """
+        return self._vocabulary.get_token2id()
+
+    def get_id2token(self):
+        """
+        Return a `dict`. Built on every call, the tokenizer itself maps ids to tokens
+        with an array.
+        """
+        return self._vocabulary.get_id2token()
+
+    def get_vocabulary(self):
+        """
+        Return the `Vocabulary` object behind the tokenizer.
+        """
+        return self._vocabulary
+
     def load_stopwords(self, stopwords_path):
         """
         Load custom stopwords into the tokenizer. Only UTF-8 encoding files.
@@ -373,6 +946,8 @@ class BasicTokenizer(Tokenizer):
         with open(stopwords_path, mode='r', encoding='utf-8') as f:
             self._stop_words = set([x.strip() for x in f])
         logger.info('Load stopwords from {}.'.format(stopwords_path))
+        self._build_stopword_mask()
+        self._clear_cache()
 
     def get_stopwords(self):
         """
@@ -2,21 +2,216 @@
 import argparse
 import logging
 import os
-import numpy as np
+import time
 import torch
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
+from torch.utils.data import DataLoader
 from tqdm import tqdm
+from .checkpoint import CheckpointManager
 from .early_stopping import EarlyStopping
+from .metrics import ClassificationMetrics
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-assert torch.cuda.is_available()
-device = torch.device("cuda:0")
+
+def get_device(device=None):
+    """
+    Return `device` as a `torch.device`, or pick one at runtime: CUDA, then MPS, then CPU.
+    """
+    if device is not None:
+        return torch.device(device)
+    if torch.cuda.is_available():
+        return torch.device('cuda')
+    if getattr(torch.backends, 'mps', None) is not None and torch.backends.mps.is_available():
+        return torch.device('mps')
+    return torch.device('cpu')
+
+
+def make_loader(dataset, batch_size, shuffle=False, num_workers=0, pin_memory=None, prefetch_factor=None,
+                device=None, **kwargs):
+    """
+    Build a `DataLoader` with the options that matter for throughput.
+
+    :param num_workers: Number of loading processes, `0` to load in the training process.
+    :param pin_memory: Copy batches into pinned memory, so that they are sent to the GPU
+        asynchronously. Default to `True` on CUDA.
+    :param prefetch_factor: Number of batches loaded ahead by each worker. Only used with `num_workers > 0`.
+    :param device: The training device, see `get_device`.
+    :param kwargs: Passed to `DataLoader`.
+    """
+    if pin_memory is None:
+        pin_memory = get_device(device).type == 'cuda'
+    if num_workers > 0:
+        kwargs.setdefault('persistent_workers', True)
+        if prefetch_factor is not None:
+            kwargs['prefetch_factor'] = prefetch_factor
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      pin_memory=pin_memory, **kwargs)
+
+
+def _synchronize(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    elif device.type == 'mps':
+        torch.mps.synchronize()
+
+
+def _to_device(sample, device, non_blocking):
+    x, y = sample[0], sample[1]
+    return x.to(device, non_blocking=non_blocking).long(), y.to(device, non_blocking=non_blocking).long()
+
+
+def train_epoch(model, loader, criterion, optimizer, device, accumulation_steps=1, synchronize=False,
+                progress=True, desc=None):
+    """
+    Train `model` for one epoch.
+
+    The time of each step is split between waiting for the loader (`data_seconds`) and moving the
+    batch, forward, backward and optimizer step (`compute_seconds`). On CUDA and MPS, kernels run
+    asynchronously, so part of the compute time is counted as waiting for data. Set `synchronize`
+    to synchronize the device at the end of each step and attribute the time correctly, at the cost
+    of the overlap between the host and the device, so only when profiling.
+
+    :param accumulation_steps: Number of batches whose gradients are accumulated before each optimizer step.
+        The last accumulation of the epoch may be shorter, its gradients are averaged over its own batches.
+    :param progress: Show a progress bar.
+    :return: A `dict` with the mean `loss`, `samples`, `samples_per_sec`, `data_seconds`,
+        `compute_seconds` and `seconds`.
+    """
+    model.train()
+    non_blocking = device.type == 'cuda'
+    total_loss = torch.zeros((), device=device)
+    samples = 0
+    data_seconds = 0.0
+    compute_seconds = 0.0
+
+    try:
+        total = len(loader)
+    except TypeError:
+        # The loader of an `IterableDataset` has no length.
+        total = None
+
+    optimizer.zero_grad()
+    pbar = tqdm(desc=desc, total=total, disable=not progress)
+    start = time.perf_counter()
+    step_end = start
+    i = -1
+    for i, sample in enumerate(loader):
+        fetched = time.perf_counter()
+        data_seconds += fetched - step_end
+
+        x, y = _to_device(sample, device, non_blocking)
+        loss = criterion(model(x), y)
+        (loss / accumulation_steps).backward()
+        if (i + 1) % accumulation_steps == 0:
+            optimizer.step()
+            optimizer.zero_grad()
+        total_loss += loss.detach() * len(y)
+        samples += len(y)
+        if synchronize:
+            _synchronize(device)
+
+        step_end = time.perf_counter()
+        compute_seconds += step_end - fetched
+        pbar.update()
+
+    # Apply the gradients of the last, incomplete accumulation, averaged over its own batches.
+    remainder = (i + 1) % accumulation_steps
+    if remainder != 0:
+        with torch.no_grad():
+            for group in optimizer.param_groups:
+                for param in group['params']:
+                    if param.grad is not None:
+                        param.grad.mul_(accumulation_steps / remainder)
+        optimizer.step()
+        optimizer.zero_grad()
+    pbar.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        'loss': total_loss.item() / samples if samples else 0.0,
+        'samples': samples,
+        'samples_per_sec': samples / seconds if seconds else 0.0,
+        'data_seconds': data_seconds,
+        'compute_seconds': compute_seconds,
+        'seconds': seconds,
+    }
+
+
+def evaluate(model, loader, criterion, device, num_classes=None):
+    """
+    Evaluate `model` under inference mode. Metrics are accumulated on the device and read back
+    once, see `ClassificationMetrics`.
+
+    :param num_classes: Number of classes. `None` to take it from the width of the outputs.
+    :return: A `dict` with the sample-weighted mean `loss`, `acc`, per-class `precision` and
+        `recall`, and `confusion_matrix`.
+    """
+    model.eval()
+    non_blocking = device.type == 'cuda'
+    metrics = ClassificationMetrics(num_classes)
+    with torch.inference_mode():
+        for sample in loader:
+            x, y = _to_device(sample, device, non_blocking)
+            outputs = model(x)
+            metrics.update(outputs, y, criterion(outputs, y))
+    return metrics.compute()
+
+
+def fit(model, train_loader, valid_loader, criterion, optimizer, epochs, device=None, scheduler=None,
+        accumulation_steps=1, stopper=None, checkpoint_manager=None, synchronize=False, progress=True):
+    """
+    Train and validate `model` for `epochs` epochs, or until `stopper` (an `EarlyStopping` on the
+    validation loss) stops it.
+
+    :param scheduler: Stepped with the validation loss after each epoch (e.g. `ReduceLROnPlateau`).
+    :param synchronize: Synchronize the device after each step to profile it, see `train_epoch`.
+    :param checkpoint_manager: A `CheckpointManager` saving the model, optimizer and scheduler at
+        the end of every epoch, scored by the validation loss. It writes in the background while
+        the next epoch trains, and is closed when training ends.
+    :return: The history, a list of `dict` per epoch merging the results of `train_epoch` and
+        the validation `valid_loss`, `valid_acc`, `valid_precision` and `valid_recall`.
+    """
+    device = get_device(device)
+    model.to(device)
+    history = []
+    for epoch in range(epochs):
+        stats = train_epoch(model, train_loader, criterion, optimizer, device, accumulation_steps,
+                            synchronize, progress, desc=f'Epoch {epoch}')
+        valid = evaluate(model, valid_loader, criterion, device)
+        stats.update(epoch=epoch, valid_loss=valid['loss'], valid_acc=valid['acc'],
+                     valid_precision=valid['precision'], valid_recall=valid['recall'])
+        history.append(stats)
+
+        logger.info('Epoch {}, loss {:.5f}, valid loss {:.5f}, valid acc {:.4f}'.format(
+            epoch, stats['loss'], stats['valid_loss'], stats['valid_acc']))
+        logger.info('Epoch {}, {:.1f} samples/s, waiting for data {:.2f} s ({:.1%}), compute {:.2f} s'.format(
+            epoch, stats['samples_per_sec'], stats['data_seconds'],
+            stats['data_seconds'] / stats['seconds'] if stats['seconds'] else 0.0, stats['compute_seconds']))
+
+        if scheduler is not None:
+            scheduler.step(valid['loss'])
+        if checkpoint_manager is not None:
+            checkpoint_manager.save({
+                'epoch': epoch,
+                'loss': stats['loss'],
+                'valid_loss': valid['loss'],
+                'valid_acc': float(valid['acc']),
+                'model_state_dict': model.state_dict(),
+                'optimizer_state_dict': optimizer.state_dict(),
+                'scheduler_state_dict': scheduler.state_dict() if scheduler is not None else None,
+            }, score=valid['loss'])
+        if stopper is not None and stopper.step(valid['loss'])[0]:
+            logger.info('Early stopping at epoch {}.'.format(epoch))
+            break
+    if checkpoint_manager is not None:
+        checkpoint_manager.close()
+    return history
 
 
 def train(**kwargs):
+    from sklearn.model_selection import train_test_split
+
     # Load your dataset.
     # ...
 
@@ -27,23 +222,21 @@ def train(**kwargs):
     x_train, x_valid, y_train, y_valid = train_test_split(x_set, y_set, test_size=0.2,
                                                           shuffle=True, stratify=y_set)
 
-    # Init data loader utilities. 
+    # Init data loader utilities.
     train_set = TitleDataset(x_train, y_train, maxlen)
     valid_set = TitleDataset(x_valid, y_valid, maxlen)
 
     logger.info('Train set size: {}, valid set size {}'.format(
         len(train_set), len(valid_set)))
 
-    train_loader = DataLoader(train_set,
-                              batch_size=kwargs['batch_size'],
-                              shuffle=True)
-
-    valid_loader = DataLoader(valid_set,
-                              batch_size=kwargs['batch_size'],
-                              shuffle=True)
+    device = get_device(kwargs['device'])
+    loader_kwargs = dict(num_workers=kwargs['num_workers'], pin_memory=kwargs['pin_memory'],
+                         prefetch_factor=kwargs['prefetch_factor'], device=device)
+    train_loader = make_loader(train_set, kwargs['batch_size'], shuffle=True, **loader_kwargs)
+    valid_loader = make_loader(valid_set, kwargs['batch_size'], **loader_kwargs)
 
     # Init the model.
-    # model = TextCNN(kwargs['mode']).cuda(device)
+    # model = TextCNN(kwargs['mode'])
 
     # List all modules inside the model.
     logger.info('Model modules:')
@@ -63,68 +256,14 @@ def train(**kwargs):
     optimizer = torch.optim.Adam(model.parameters(), lr=kwargs['lr'])
     scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer,
                                                            mode='min',
-                                                           patience=8,
-                                                           verbose=True
-                                                           )
+                                                           patience=8)
     stopper = EarlyStopping()
+    # Keep the best checkpoints by validation loss, and the last one to resume from.
+    checkpoint_manager = CheckpointManager(config.CHECKPOINTS_DIR, prefix=kwargs['model'],
+                                           top_k=kwargs['keep_checkpoints'], stopper=stopper)
 
-    for epoch in range(kwargs['epoch']):
-        # =======================Training===========================
-        # Set model to train mode.
-        model.train()
-        steps = int(np.ceil(len(train_set) // kwargs['batch_size']))
-        pbar = tqdm(desc='Epoch {}, loss {}'.format(epoch, 'NAN'),
-                    total=steps)
-        for i, sample in enumerate(train_loader):
-            x, y = sample[0].cuda(device).long(), sample[1].cuda(device).long()
-            optimizer.zero_grad()
-
-            outputs = model(x)
-            loss = criterion(outputs, y)
-
-            loss.backward()
-            optimizer.step()
-            pbar.set_description(
-                'Epoch {}, training loss {:.5f}'.format(epoch, loss.item()))
-            pbar.update()
-        pbar.close()
-        # =========================================================
-        # =======================Validation========================
-        # Set model to evaluation mode.
-        model.eval()
-        # Validation step
-        valid_loss = 0.0
-        valid_acc = 0.0
-        for i, sample in enumerate(valid_loader):
-            y_true_local = sample[1].numpy()
-            x, y_true = sample[0].cuda(
-                device).long(), sample[1].cuda(device).long()
-
-            outputs = model(x)
-            loss = criterion(outputs, y_true)
-            y_pred = outputs.argmax(dim=1).cpu().numpy()
-            valid_loss += loss.item()
-            valid_acc += accuracy_score(y_true_local, y_pred)
-        steps = i + 1
-        valid_loss /= steps
-        valid_acc /= steps
-        
-        # Apply ReduceLROnPlateau to the lr.
-        scheduler.step(valid_loss)
-
-        logger.info('Epoch {}, valid loss {:.5f}, valid acc {:.4f}'.format(
-            epoch, valid_loss, valid_acc))
-        # ==========================================================
-        # Save the model at the end of every epoch.
-        torch.save({
-            'model_name': kwargs['model'],
-            'epoch': epoch,
-            'loss': loss,
-            'valid_acc': valid_acc,
-            'model_state_dict':  model.state_dict(),
-            'optimizer_state_dict': optimizer.state_dict(),
-            'scheduler_state_dict': scheduler.state_dict()
-        }, f=os.path.join(config.CHECKPOINTS_DIR, f'{kwargs["model"]}.pt'))
+    return fit(model, train_loader, valid_loader, criterion, optimizer, kwargs['epoch'], device,
+               scheduler, kwargs['accumulation_steps'], stopper, checkpoint_manager, kwargs['profile'])
 
 
 if __name__ == '__main__':
@@ -136,6 +275,20 @@ if __name__ == '__main__':
                         type=int, help='Batch size.')
     parser.add_argument('-e', '--epoch', default=100,
                         type=int, help='Number of training epoch.')
+    parser.add_argument('--device', default=None,
+                        help='Training device, e.g. `cpu` or `cuda:0`. Picked at runtime by default.')
+    parser.add_argument('--num_workers', default=0,
+                        type=int, help='Number of DataLoader workers.')
+    parser.add_argument('--pin_memory', default=None, type=lambda x: x.lower() in ['1', 'true', 'yes'],
+                        help='Use pinned memory. Default to true on CUDA.')
+    parser.add_argument('--prefetch_factor', default=None,
+                        type=int, help='Batches loaded ahead by each worker.')
+    parser.add_argument('--accumulation_steps', default=1,
+                        type=int, help='Number of batches per optimizer step.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Synchronize the device after each step, to split time between data and compute.')
+    parser.add_argument('--keep_checkpoints', default=1,
+                        type=int, help='Number of best checkpoints kept.')
 
     kwargs = vars(parser.parse_args())
 
@@ -152,8 +305,7 @@ if __name__ == '__main__':
     logger.addHandler(stream_handler)
     logger.addHandler(file_handler)
 
-    logger.info('Using device {}'.format(
-        torch.cuda.get_device_properties(device)))
+    logger.info('Using device {}'.format(get_device(kwargs['device'])))
     logger.info(kwargs)
 
     train(**kwargs)
@@ -1,17 +1,123 @@
 import collections
+import heapq
+import math
+import operator
+import os
+import pickle
+import shutil
+import tempfile
 from .tokenizer import DEFAULT_SPECIAL_TOKENS
 from itertools import chain
-from collections import Iterable
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Number of (token, count, position) items pickled together in a spill file.
+_SPILL_BLOCK_SIZE = 10000
+
+
+def _iter_file_samples(fpath, sep=None):
+    """
+    Yield the token list of each line of a UTF-8 file, tokens being separated by `sep`.
+    """
+    with open(fpath, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.split(sep)
+
+
+def _spill(counter, spill_dir):
+    """
+    Write a partial count to disk, sorted by token. Each token comes with its position in
+    `counter`, that is the order in which it was first seen.
+
+    :return: Path of the spill file.
+    """
+    items = sorted((t, c, i) for i, (t, c) in enumerate(counter.items()))
+    fd, fpath = tempfile.mkstemp(suffix='.counts', dir=spill_dir)
+    with os.fdopen(fd, 'wb') as f:
+        for i in range(0, len(items), _SPILL_BLOCK_SIZE):
+            pickle.dump(items[i:i + _SPILL_BLOCK_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return fpath
+
+
+def _iter_spill(fpath, order):
+    """
+    Read back a spill file, `order` identifies the partial count it was written from.
+    """
+    with open(fpath, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            for token, count, position in block:
+                yield token, count, (order, position)
+
+
+def _select_threshold(count_of_counts, size):
+    """
+    Find the count of the `size`-th most frequent token from the number of tokens of every count.
+
+    :return: A tuple `(threshold, ties)`: the `size` most frequent tokens are those whose count is
+        above `threshold`, plus the first `ties` of those whose count is `threshold`.
+    """
+    above = 0
+    for count in sorted(count_of_counts, reverse=True):
+        if above + count_of_counts[count] >= size:
+            return count, size - above
+        above += count_of_counts[count]
+    return 0, 0
+
+
+def _count_source(source, sep=None, max_distinct_tokens=None, spill_dir=None):
+    """
+    Count the tokens of a source, either a file path or a Iterable of samples.
+
+    Once the partial count holds more than `max_distinct_tokens` tokens, it is spilled to
+    `spill_dir` and counting restarts from scratch.
+
+    :return: A tuple `(spill_paths, counter)`, `counter` holds the tokens counted after the last spill.
+    """
+    if isinstance(source, (str, Path)):
+        samples = _iter_file_samples(source, sep)
+    else:
+        samples = source
+
+    spill_paths = []
+    counter = collections.Counter()
+    for sample in samples:
+        if isinstance(sample, Iterable) and not isinstance(sample, str):
+            counter.update(sample)
+        else:
+            counter[sample] += 1
+        if max_distinct_tokens is not None and len(counter) > max_distinct_tokens:
+            spill_paths.append(_spill(counter, spill_dir))
+            counter = collections.Counter()
+    return spill_paths, counter
 
 
 class VocabGenerator(object):
     """
     A tool class to generate a vocabulary. By default it contains all common special tokens listed in `tokenizer.py`.
+
+    Tokens are ordered by decreasing count, then by first occurrence. The cutoffs only sort the
+    tokens that are kept: the count of the last kept token is found from the number of tokens of
+    every count, then a single pass collects the tokens above it.
     """
 
-    def __init__(self, min_count=None):
+    def __init__(self, min_count=None, max_size=None, coverage=None):
+        """
+        :param min_count: Keep tokens appearing more than `min_count` times.
+        :param max_size: Keep at most the `max_size` most frequent tokens (special tokens excluded).
+        :param coverage: Keep the fewest most frequent tokens that cover at least this fraction of
+            the token occurrences of the corpus, e.g. `0.95`. `1.0` keeps every token.
+        """
+        assert coverage is None or 0 < coverage <= 1
         self._min_count = min_count
+        self._max_size = max_size
+        self._coverage = coverage
         self._token2tf = {}
+        self._count_of_counts = collections.Counter()
         self._vocab = list(DEFAULT_SPECIAL_TOKENS.values())
 
     def generate_vocab(self, corpus):
@@ -30,17 +136,208 @@ class VocabGenerator(object):
 
         # self._count_and_normalize_tf(flat_samples_iter)
         self._token2tf = collections.Counter(flat_samples_iter)
-        
-        v = self._token2tf.most_common()
-        if self._min_count is not None:
-            v = filter(lambda x: x[1] > self._min_count, v)
-        self._vocab.extend([x[0] for x in v])
+
+        self._vocab.extend(self._select_tokens(self._token2tf))
         return self._vocab
 
+    def generate_vocab_from_stream(self, sources, workers=1, max_distinct_tokens=None, spill_dir=None, sep=None):
+        """
+        Generate vocabulary from one or several streams of samples, without holding the corpus
+        in memory.
+
+        Each source is either a file path, with one sample per line and tokens separated by `sep`,
+        or a Iterable of samples (e.g. a generator of word lists). File sources are counted in
+        parallel by `workers` processes. Memory is bounded by spilling partial counts holding more
+        than `max_distinct_tokens` tokens to `spill_dir`, and merging the spilled counts from disk,
+        where only the tokens of the vocabulary are held in memory.
+        The cutoffs are applied once everything is counted, so the vocabulary (order included) is
+        the same as the one from `generate_vocab` on the whole corpus.
+
+        :param sources: A list of file paths and/or Iterables of samples.
+        :param workers: Number of processes counting file sources.
+        :param max_distinct_tokens: Max number of distinct tokens held by a partial count. `None` for no limit.
+        :param spill_dir: Directory for spilled counts. Default to a temporary directory.
+        :param sep: Token separator in file sources. `None` for whitespaces.
+        :return: The generated vocabulary as a list.
+        """
+        cleanup = max_distinct_tokens is not None and spill_dir is None
+        if cleanup:
+            spill_dir = tempfile.mkdtemp(prefix='nlputils-vocab-')
+
+        try:
+            parts = self._count_sources(sources, workers, max_distinct_tokens, spill_dir, sep)
+            if all(not spill_paths for spill_paths, _ in parts):
+                # Partial counts are merged in source order, tokens keep the order they were first seen.
+                token2tf = collections.Counter()
+                for _, counter in parts:
+                    token2tf.update(counter)
+                    if max_distinct_tokens is not None and len(token2tf) > max_distinct_tokens:
+                        break
+                else:
+                    self._token2tf = token2tf
+                    self._vocab.extend(self._select_tokens(token2tf))
+                    return self._vocab
+
+            self._token2tf = self._merge_spilled_counts(parts, spill_dir)
+            self._vocab.extend(self._token2tf)
+            return self._vocab
+        finally:
+            if cleanup:
+                shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def _count_sources(self, sources, workers, max_distinct_tokens, spill_dir, sep):
+        """
+        Count every source, files in a pool of processes and Iterables in the current one.
+
+        :return: A list of `(spill_paths, counter)`, in the same order as `sources`.
+        """
+        sources = list(sources)
+        is_file = [isinstance(x, (str, Path)) for x in sources]
+        parts = [None] * len(sources)
+
+        if workers > 1 and any(is_file):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {i: executor.submit(_count_source, x, sep, max_distinct_tokens, spill_dir)
+                           for i, x in enumerate(sources) if is_file[i]}
+                for i, x in enumerate(sources):
+                    if not is_file[i]:
+                        parts[i] = _count_source(x, sep, max_distinct_tokens, spill_dir)
+                for i, future in futures.items():
+                    parts[i] = future.result()
+        else:
+            parts = [_count_source(x, sep, max_distinct_tokens, spill_dir) for x in sources]
+        return parts
+
+    def _merge_spilled_counts(self, parts, spill_dir):
+        """
+        Merge partial counts with a k-way merge of the sorted spill files, in two streaming passes:
+        the first one counts the tokens of every count to find the cutoff, the second one collects
+        the tokens kept by it. Only the kept tokens are held in memory.
+
+        :return: A `Counter` of the kept tokens, ordered as `Counter.most_common()` would on the
+            exact count.
+        """
+        streams = []
+        for source_index, (spill_paths, counter) in enumerate(parts):
+            if counter:
+                spill_paths = spill_paths + [_spill(counter, spill_dir)]
+            # A token was first seen in the earliest source, earliest spill, earliest position.
+            streams.extend((x, (source_index, i)) for i, x in enumerate(spill_paths))
+
+        count_of_counts = collections.Counter()
+        for _, count, _ in self._iter_merged(streams):
+            count_of_counts[count] += 1
+        self._count_of_counts = count_of_counts
+        threshold, ties = _select_threshold(count_of_counts, self._get_size(count_of_counts))
+
+        kept = []
+        # The `ties` tokens of count `threshold` first seen, in a heap whose root is the last seen.
+        at_threshold = []
+        for token, count, first_seen in self._iter_merged(streams):
+            if count > threshold:
+                kept.append((token, count, first_seen))
+            elif count == threshold and ties > 0:
+                (order, i), position = first_seen
+                # Tokens are distinct, so `first_seen` is never compared.
+                heapq.heappush(at_threshold, ((-order, -i, -position), token, first_seen))
+                if len(at_threshold) > ties:
+                    heapq.heappop(at_threshold)
+        kept.extend((token, threshold, first_seen) for _, token, first_seen in at_threshold)
+        kept.sort(key=lambda x: (-x[1], x[2]))
+        return collections.Counter({t: c for t, c, _ in kept})
+
+    @staticmethod
+    def _iter_merged(streams):
+        """
+        Yield `(token, count, first_seen)` for every distinct token of the spill files `streams`, a
+        list of `(path, order)`, in token order.
+        """
+        token, count, first_seen = None, 0, None
+        merged = heapq.merge(*(_iter_spill(fpath, order) for fpath, order in streams))
+        for t, c, seen in merged:
+            if t == token and token is not None:
+                count += c
+                first_seen = min(first_seen, seen)
+                continue
+            if token is not None:
+                yield token, count, first_seen
+            token, count, first_seen = t, c, seen
+        if token is not None:
+            yield token, count, first_seen
+
+    def _get_size(self, count_of_counts):
+        """
+        Return the number of tokens kept by the cutoffs, given the number of tokens of every count.
+        """
+        counts = sorted(count_of_counts, reverse=True)
+        if self._min_count is not None:
+            counts = [c for c in counts if c > self._min_count]
+        size = sum(count_of_counts[c] for c in counts)
+        if self._max_size is not None:
+            size = min(size, self._max_size)
+
+        if self._coverage is not None:
+            total = sum(c * n for c, n in count_of_counts.items())
+            needed = 0
+            covered = 0
+            for c in counts:
+                if covered >= self._coverage * total:
+                    break
+                # Number of tokens of count `c` left to reach the coverage.
+                n = min(count_of_counts[c], max(1, math.ceil((self._coverage * total - covered) / c)))
+                if covered + (n - 1) * c >= self._coverage * total:
+                    n -= 1
+                needed += n
+                covered += n * c
+            size = min(size, needed)
+        return size
+
+    def _select_tokens(self, token2tf):
+        """
+        Return the tokens of `token2tf` kept by the cutoffs, ordered as `Counter.most_common()`
+        would, without sorting the others.
+        """
+        self._count_of_counts = collections.Counter(token2tf.values())
+        threshold, ties = _select_threshold(self._count_of_counts, self._get_size(self._count_of_counts))
+        selected = []
+        for token, count in token2tf.items():
+            if count > threshold:
+                selected.append((token, count))
+            elif count == threshold and ties > 0:
+                selected.append((token, count))
+                ties -= 1
+        # A stable sort keeps tokens of the same count in the order they were first seen.
+        selected.sort(key=operator.itemgetter(1), reverse=True)
+        return [x[0] for x in selected]
+
+    def get_coverage_curve(self):
+        """
+        Return the fraction of the token occurrences of the corpus covered by the vocabulary, as a
+        function of its size (special tokens excluded), e.g. to pick the smallest vocabulary, and
+        embedding table, reaching a target coverage.
+
+        The curve is a list of `(size, coverage)` with one point per distinct count, `size` being the
+        number of tokens appearing at least that many times. Coverage grows linearly between two points.
+        """
+        total = sum(c * n for c, n in self._count_of_counts.items())
+        curve = []
+        size = 0
+        covered = 0
+        for c in sorted(self._count_of_counts, reverse=True):
+            size += self._count_of_counts[c]
+            covered += c * self._count_of_counts[c]
+            curve.append((size, covered / total))
+        return curve
+
     def get_vocab(self):
         return self._vocab
 
     def get_token2tf(self):
+        """
+        Return the count of every token. After `generate_vocab_from_stream` spilled counts to disk,
+        only the tokens kept in the vocabulary are counted here, holding all of them would defeat
+        the spilling. `get_coverage_curve` still covers every token.
+        """
         return self._token2tf
 
     def save_vocab_to(self, fpath):
@@ -0,0 +1,293 @@
+# coding=utf-8
+import hashlib
+import zlib
+import numpy as np
+from collections.abc import Iterable
+
+
+def _digest_tokens(tokens):
+    """
+    Return a SHA-256 hex digest of a list of tokens, order included.
+    """
+    h = hashlib.sha256()
+    h.update(str(len(tokens)).encode('utf-8'))
+    for t in tokens:
+        h.update(t.encode('utf-8') + b'\x00')
+    return h.hexdigest()
+
+
+class Vocabulary(object):
+    """
+    A vocabulary with constant-time lookups in both directions.
+
+    Tokens are mapped to ids with a hash table (`dict`), ids are mapped back to tokens
+    with a contiguous NumPy array, so the cost of a lookup does not depend on the size
+    of the vocabulary. Ids are generated using `range(len(tokens))`.
+
+    If `unk_token` is given and present in the vocabulary, unknown tokens and out of range
+    ids fall back to it.
+    """
+
+    def __init__(self, tokens=(), unk_token=None):
+        if not isinstance(tokens, Iterable) or isinstance(tokens, str):
+            raise ValueError('Vocabulary can only be built from a Iterable of tokens.')
+
+        tokens = list(tokens)
+        self._id2token = np.empty(len(tokens), dtype=object)
+        self._id2token[:] = tokens
+        self._token2id = {t: i for i, t in enumerate(tokens)}
+        self._unk_token = unk_token
+        self._unk_id = self._token2id.get(unk_token)
+        self._digest = None
+
+    def __len__(self):
+        return len(self._id2token)
+
+    def __contains__(self, token):
+        return token in self._token2id
+
+    def __iter__(self):
+        return iter(self._id2token)
+
+    @property
+    def unk_id(self):
+        return self._unk_id
+
+    def token_to_id(self, token):
+        """
+        Convert a token to an id. Unknown tokens are mapped to the id of `unk_token`.
+        """
+        index = self._token2id.get(token, self._unk_id)
+        if index is None:
+            raise KeyError(token)
+        return index
+
+    def id_to_token(self, index):
+        """
+        Convert an id to a token. Out of range ids are mapped to `unk_token`.
+        """
+        if 0 <= index < len(self._id2token):
+            return self._id2token[index]
+        if self._unk_id is None:
+            raise IndexError(index)
+        return self._unk_token
+
+    def tokens_to_ids(self, tokens):
+        """
+        Convert a list of tokens to a list of ids. Return a list with the same length.
+        """
+        if self._unk_id is None:
+            return [self._token2id[t] for t in tokens]
+        get = self._token2id.get
+        unk_id = self._unk_id
+        return [get(t, unk_id) for t in tokens]
+
+    def ids_to_tokens(self, ids):
+        """
+        Convert ids to tokens in one vectorized operation.
+
+        :param ids: A list or a NumPy array (of any shape) of ids.
+        :return: A NumPy array of tokens with the same shape as `ids`.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        invalid = (ids < 0) | (ids >= len(self._id2token))
+        if invalid.any():
+            if self._unk_id is None:
+                raise IndexError(ids[invalid].tolist())
+            ids = np.where(invalid, self._unk_id, ids)
+        return self._id2token[ids]
+
+    def get_tokens(self):
+        """
+        Return the tokens as a list, ordered by id.
+        """
+        return self._id2token.tolist()
+
+    def digest(self):
+        """
+        Return a SHA-256 hex digest of the tokens, computed once.
+        """
+        if getattr(self, '_digest', None) is None:
+            self._digest = _digest_tokens(self.get_tokens())
+        return self._digest
+
+    def get_token2id(self):
+        """
+        Return a `dict`.
+        """
+        return self._token2id
+
+    def get_id2token(self):
+        """
+        Return a `dict`. Built on every call, prefer `id_to_token` or `ids_to_tokens`.
+        """
+        return dict(enumerate(self._id2token.tolist()))
+
+
+class MappedVocabulary(object):
+    """
+    A read-only vocabulary backed by a memory-mapped tokenizer file (see `serialization.py`).
+
+    Tokens are stored as one UTF-8 blob with an offset table, and an open addressing hash table
+    of their ids is stored in the same file. Nothing is copied at load time, so loading is fast
+    and processes mapping the same file share its pages. It has the same interface as `Vocabulary`.
+
+    Probing the mapped table from Python is about 3 times slower than a `dict`, so the first
+    `tokens_to_ids` (i.e. encoding) builds a `dict` of the tokens, once per process, which later
+    lookups use. Single lookups before it probe the table, so loading stays cheap. Ids are still
+    mapped back to tokens from the shared pages.
+    """
+
+    def __init__(self, offsets, blob, table, unk_token=None, fpath=None, digest=None):
+        """
+        :param offsets: int64 array, token `i` is `blob[offsets[i]:offsets[i+1]]`.
+        :param blob: uint8 array of the UTF-8 encoded tokens.
+        :param table: int32 hash table of ids, `-1` for empty slots.
+        :param unk_token: Unknown tokens and out of range ids fall back to it.
+        :param fpath: The mapped file, used to map it again when unpickled.
+        :param digest: The digest of the tokens stored with them, see `digest`. `None` to compute it.
+        """
+        self._offsets = offsets
+        self._blob = blob
+        self._table = table
+        # Typed memoryviews make scalar indexing much cheaper than on NumPy arrays.
+        self._offsets_view = memoryview(offsets)
+        self._blob_view = memoryview(blob)
+        self._table_view = memoryview(table)
+        self._mask = len(table) - 1
+        self._fpath = fpath
+        self._unk_token = unk_token
+        self._unk_id = self._lookup(unk_token) if unk_token is not None else None
+        self._digest = digest
+        # Built on first use, see `_get_tokens` and `_get_token2id`.
+        self._token2id = None
+        self._tokens = None
+
+    def __getstate__(self):
+        if self._fpath is None:
+            raise TypeError('Can not pickle a MappedVocabulary without its file path.')
+        return {'fpath': self._fpath, 'unk_token': self._unk_token}
+
+    def __setstate__(self, state):
+        from .serialization import map_vocabulary
+        other = map_vocabulary(state['fpath'], state['unk_token'])
+        self.__dict__.update(other.__dict__)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __contains__(self, token):
+        if self._token2id is not None:
+            return token in self._token2id
+        return self._lookup(token) is not None
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode(i)
+
+    @property
+    def unk_id(self):
+        return self._unk_id
+
+    def _decode(self, index):
+        return str(self._blob_view[self._offsets_view[index]:self._offsets_view[index + 1]], 'utf-8')
+
+    def _lookup(self, token):
+        data = token.encode('utf-8')
+        slot = zlib.crc32(data) & self._mask
+        while True:
+            index = self._table_view[slot]
+            if index < 0:
+                return None
+            if self._blob_view[self._offsets_view[index]:self._offsets_view[index + 1]] == data:
+                return index
+            slot = (slot + 1) & self._mask
+
+    def _get_tokens(self):
+        if self._tokens is None:
+            from .serialization import _decode_strings
+            self._tokens = _decode_strings(self._offsets, self._blob)
+        return self._tokens
+
+    def _get_token2id(self):
+        if self._token2id is None:
+            self._token2id = {t: i for i, t in enumerate(self._get_tokens())}
+        return self._token2id
+
+    def token_to_id(self, token):
+        """
+        Convert a token to an id. Unknown tokens are mapped to the id of `unk_token`.
+        """
+        if self._token2id is not None:
+            index = self._token2id.get(token, self._unk_id)
+        else:
+            index = self._lookup(token)
+            if index is None:
+                index = self._unk_id
+        if index is None:
+            raise KeyError(token)
+        return index
+
+    def id_to_token(self, index):
+        """
+        Convert an id to a token. Out of range ids are mapped to `unk_token`.
+        """
+        if 0 <= index < len(self):
+            return self._decode(index)
+        if self._unk_id is None:
+            raise IndexError(index)
+        return self._unk_token
+
+    def tokens_to_ids(self, tokens):
+        """
+        Convert a list of tokens to a list of ids. Return a list with the same length.
+        """
+        token2id = self._get_token2id()
+        if self._unk_id is None:
+            return [token2id[t] for t in tokens]
+        get = token2id.get
+        unk_id = self._unk_id
+        return [get(t, unk_id) for t in tokens]
+
+    def ids_to_tokens(self, ids):
+        """
+        Convert ids to tokens.
+
+        :param ids: A list or a NumPy array (of any shape) of ids.
+        :return: A NumPy array of tokens with the same shape as `ids`.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        invalid = (ids < 0) | (ids >= len(self))
+        if invalid.any():
+            if self._unk_id is None:
+                raise IndexError(ids[invalid].tolist())
+            ids = np.where(invalid, self._unk_id, ids)
+        tokens = np.empty(ids.shape, dtype=object)
+        tokens.flat[:] = [self._decode(i) for i in ids.ravel().tolist()]
+        return tokens
+
+    def get_tokens(self):
+        """
+        Return the tokens as a list, ordered by id. They are decoded once per process.
+        """
+        return list(self._get_tokens())
+
+    def get_token2id(self):
+        """
+        Return a `dict`.
+        """
+        return self._get_token2id()
+
+    def digest(self):
+        """
+        Return a SHA-256 hex digest of the tokens, read from the file when it was saved with it.
+        """
+        if self._digest is None:
+            self._digest = _digest_tokens(self._get_tokens())
+        return self._digest
+
+    def get_id2token(self):
+        """
+        Return a `dict`. Built on every call, prefer `id_to_token` or `ids_to_tokens`.
+        """
+        return dict(enumerate(self))
@@ -19,6 +19,9 @@ setuptools.setup(
     # `package_dir` param need to be included.
     # package_dir={"": "src"},     
     include_package_data=True, # Include everything in the package, else __init__.py only.
-    python_requires='>=3.6',
+    python_requires='>=3.7',
+    entry_points={
+        'console_scripts': ['nlputils=nlputils.cli:main'],
+    },
     zip_safe=False
 )
\ No newline at end of file
@@ -2,12 +2,41 @@ from nlputils.vocab_generator import VocabGenerator
 from nlputils.tokenizer import BasicTokenizer
 
 import logging
+import tempfile
+from pathlib import Path
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s %(name)s %(levelname)s %(message)s",
                     datefmt='%Y-%m-%d  %H:%M:%S %a')
 
 
+def _parse_sample(line):
+    import torch
+    label, text = line.split('\t')
+    return torch.tensor([ord(c) % 16 for c in text]), int(label)
+
+
+def test_train_sharded_iterable():
+    import torch
+    from torch.utils.data import DataLoader
+    from nlputils.dataset import ShardedIterableDataset
+    from nlputils.train_template import train_epoch
+
+    with tempfile.TemporaryDirectory() as dpath:
+        fpaths = []
+        for i in range(2):
+            fpath = Path(dpath) / f'shard-{i}.txt'
+            fpath.write_text(''.join(f'{j % 2}\tabcd\n' for j in range(5)), encoding='utf-8')
+            fpaths.append(fpath)
+        loader = DataLoader(ShardedIterableDataset(fpaths, transform=_parse_sample), batch_size=3)
+        model = torch.nn.Sequential(torch.nn.EmbeddingBag(16, 4), torch.nn.Linear(4, 2))
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+        stats = train_epoch(model, loader, torch.nn.CrossEntropyLoss(), optimizer, torch.device('cpu'),
+                            accumulation_steps=3, progress=False)
+    assert stats['samples'] == 10
+
+
 if __name__ == "__main__":
+    test_train_sharded_iterable()
     tokenizer = BasicTokenizer(language='cn')
     gen = VocabGenerator(coverage=1.0)
 